@@ -0,0 +1,225 @@
+"""
+Async storage API for the bot and worker event loops
+Runs the synchronous SQLite functions from utils.py on a dedicated DB thread
+so a slow query never blocks the python-telegram-bot / worker event loop.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+
+import utils
+
+# A single DB thread: it owns one persistent connection (see database.get_db)
+# and serializes this process's writes, so they never contend with each other.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a synchronous storage function on the DB thread and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+# Async mirrors of the utils.py storage API
+
+async def ensure_storage():
+    """Initialize database."""
+    return await run_db(utils.ensure_storage)
+
+
+async def add_user(user_data: Dict[str, Any]) -> bool:
+    """Add user to database."""
+    return await run_db(utils.add_user, user_data)
+
+
+async def add_user_if_new(user_data: Dict[str, Any]) -> bool:
+    """Add user to database unless they exist; True if inserted (raises on DB errors)."""
+    return await run_db(utils.add_user_if_new, user_data)
+
+
+async def user_exists(chat_id: int) -> bool:
+    """Check whether a user exists in database (raises on DB errors)."""
+    return await run_db(utils.user_exists, chat_id)
+
+
+async def get_all_users(reachable_only: bool = False) -> List[Dict[str, Any]]:
+    """Get all users from database."""
+    return await run_db(utils.get_all_users, reachable_only)
+
+
+async def get_user_chat_id_page(after: Optional[int], limit: int, reachable_only: bool = True,
+                                segment: Optional[Dict[str, Any]] = None) -> array:
+    """Get one keyset page of user chat IDs after `after`."""
+    return await run_db(utils.get_user_chat_id_page, after, limit, reachable_only, segment)
+
+
+async def get_broadcast_recipients(after: Optional[int], limit: int, reachable_only: bool = True,
+                                   segment: Optional[Dict[str, Any]] = None) -> Tuple[array, array]:
+    """Get one keyset page of recipient chat IDs and their bot IDs."""
+    return await run_db(utils.get_broadcast_recipients, after, limit, reachable_only, segment)
+
+
+async def iter_user_chat_ids(chunk_size: int = 1000, reachable_only: bool = True) -> AsyncIterator[array]:
+    """Stream user chat IDs in compact chunks, one DB round-trip per chunk."""
+    after = None
+    while True:
+        chunk = await get_user_chat_id_page(after, chunk_size, reachable_only)
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]
+
+
+async def create_task(chat_id: int, step_id: int, send_at: int) -> Optional[int]:
+    """Create a new scheduled task in database."""
+    return await run_db(utils.create_task, chat_id, step_id, send_at)
+
+
+async def create_tasks(rows: List[Dict[str, Any]]) -> List[int]:
+    """Create several scheduled tasks in one transaction."""
+    return await run_db(utils.create_tasks, rows)
+
+
+async def create_user_tasks(chat_id: int, start_time: int, start_payload: Optional[str] = None) -> List[int]:
+    """Create all scheduled tasks of a new user's campaign."""
+    return await run_db(utils.create_user_tasks, chat_id, start_time, start_payload)
+
+
+async def register_user(user_data: Dict[str, Any], start_time: int) -> Optional[List[int]]:
+    """Save a new user with their drip tasks; None if they already existed."""
+    return await run_db(utils.register_user, user_data, start_time)
+
+
+async def get_pending_tasks(limit: int = 1000) -> List[Dict[str, Any]]:
+    """Get the oldest due pending tasks (at most `limit`)."""
+    return await run_db(utils.get_pending_tasks, limit)
+
+
+async def claim_due_tasks(owner: str, limit: int, lease_seconds: int) -> List[Dict[str, Any]]:
+    """Atomically lease due tasks to a worker."""
+    return await run_db(utils.claim_due_tasks, owner, limit, lease_seconds)
+
+
+async def get_next_due_time() -> Optional[int]:
+    """Get the earliest time a worker will have a task to claim."""
+    return await run_db(utils.get_next_due_time)
+
+
+async def update_task_status(task_id: int, status: str, increment_retry: bool = False,
+                             send_at: Optional[int] = None, last_error: Optional[str] = None,
+                             owner: Optional[str] = None) -> bool:
+    """Update task status in database (only while `owner` holds its lease, if given)."""
+    return await run_db(utils.update_task_status, task_id, status, increment_retry, send_at, last_error, owner)
+
+
+async def defer_tasks(task_ids: List[int], not_before: int, owner: Optional[str] = None) -> int:
+    """Return claimed tasks to the queue with send_at pushed to not_before."""
+    return await run_db(utils.defer_tasks, task_ids, not_before, owner)
+
+
+async def expire_stale_tasks(supersede_after: int) -> int:
+    """Expire overdue tasks past their freshness window or superseded by a later one."""
+    return await run_db(utils.expire_stale_tasks, supersede_after)
+
+
+async def archive_finished_tasks(before: int, batch_size: int = 1000) -> int:
+    """Move one batch of finished tasks due before `before` into the archive."""
+    return await run_db(utils.archive_finished_tasks, before, batch_size)
+
+
+async def vacuum_free_pages(max_pages: int) -> int:
+    """Return up to max_pages free database pages to the file system."""
+    return await run_db(utils.vacuum_free_pages, max_pages)
+
+
+async def cancel_user_tasks(chat_id: int) -> int:
+    """Cancel all pending tasks for a user."""
+    return await run_db(utils.cancel_user_tasks, chat_id)
+
+
+async def mark_chats_unreachable(chat_ids: List[int], reason: str) -> int:
+    """Flag chats as blocked/deleted and cancel their queued tasks."""
+    return await run_db(utils.mark_chats_unreachable, chat_ids, reason)
+
+
+async def create_broadcast_job(mode: str, from_chat_id: int, message_id: int,
+                               segment: Optional[Dict[str, Any]] = None, text: Optional[str] = None,
+                               entities: Optional[List[Dict[str, Any]]] = None) -> int:
+    """Queue a broadcast for the worker."""
+    return await run_db(utils.create_broadcast_job, mode, from_chat_id, message_id, segment, text, entities)
+
+
+async def claim_broadcast_job(owner: str, lease_seconds: int) -> Optional[Dict[str, Any]]:
+    """Atomically claim the oldest runnable broadcast job."""
+    return await run_db(utils.claim_broadcast_job, owner, lease_seconds)
+
+
+async def update_broadcast_progress(job_id: int, owner: str, cursor: int, sent: int, blocked: int, failed: int,
+                                    dead_chat_ids: List[int], lease_seconds: int,
+                                    concurrency: Optional[int] = None, rate: Optional[float] = None) -> bool:
+    """Record a finished batch of a broadcast job; False if the lease was lost."""
+    return await run_db(utils.update_broadcast_progress, job_id, owner, cursor, sent, blocked, failed,
+                        dead_chat_ids, lease_seconds, concurrency, rate)
+
+
+async def renew_broadcast_lease(job_id: int, owner: str, lease_seconds: int) -> bool:
+    """Extend a running broadcast job's lease; False if it was lost."""
+    return await run_db(utils.renew_broadcast_lease, job_id, owner, lease_seconds)
+
+
+async def finish_broadcast_job(job_id: int, owner: str) -> bool:
+    """Mark a broadcast job as done, if `owner` still holds its lease."""
+    return await run_db(utils.finish_broadcast_job, job_id, owner)
+
+
+async def get_broadcast_jobs(limit: int = 5) -> List[Dict[str, Any]]:
+    """Get the most recent broadcast jobs."""
+    return await run_db(utils.get_broadcast_jobs, limit)
+
+
+async def register_worker(worker_id: str, stale_after: int) -> int:
+    """Record that a worker is alive; returns the number of live workers."""
+    return await run_db(utils.register_worker, worker_id, stale_after)
+
+
+async def unregister_worker(worker_id: str) -> bool:
+    """Remove a stopping worker."""
+    return await run_db(utils.unregister_worker, worker_id)
+
+
+async def get_results_snapshot(limit: int) -> Dict[str, Any]:
+    """Get the stored /results updates and feed position."""
+    return await run_db(utils.get_results_snapshot, limit)
+
+
+async def save_results(updates: List[Tuple[int, str]], last_message_id: int, keep: int) -> bool:
+    """Store fetched position updates and advance the feed position."""
+    return await run_db(utils.save_results, updates, last_message_id, keep)
+
+
+async def get_user_count(reachable_only: bool = False, segment: Optional[Dict[str, Any]] = None) -> int:
+    """Get total number of users."""
+    return await run_db(utils.get_user_count, reachable_only, segment)
+
+
+async def save_campaign(name: str, start_payload: Optional[str], steps: List[Dict[str, Any]]) -> Optional[int]:
+    """Create or replace a drip campaign and activate it."""
+    return await run_db(utils.save_campaign, name, start_payload, steps)
+
+
+async def set_campaign_active(name: str, active: bool) -> bool:
+    """Switch a drip campaign on or off."""
+    return await run_db(utils.set_campaign_active, name, active)
+
+
+async def get_campaigns(active_only: bool = False) -> List[Dict[str, Any]]:
+    """Get drip campaigns with their active steps."""
+    return await run_db(utils.get_campaigns, active_only)
+
+
+async def get_task_stats() -> Dict[str, int]:
+    """Get task statistics."""
+    return await run_db(utils.get_task_stats)
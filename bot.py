@@ -4,7 +4,6 @@ Handles /start, /stop, and /send commands
 """
 
 import os
-import asyncio
 import time
 from datetime import datetime
 
@@ -20,12 +19,21 @@ from telegram.ext import (
 from telegram.error import TelegramError
 from dotenv import load_dotenv
 
-from utils import (
-    add_user,
-    create_user_tasks,
+from utils import ensure_storage
+from bot_pool import load_tokens
+from results_feed import ResultsFeed, ResultsUnavailable
+from broadcast import SegmentError, parse_segment, strip_command, describe_segment
+from campaigns import CampaignError, parse_campaign, describe_campaign
+from async_storage import (
+    register_user,
     cancel_user_tasks,
-    get_all_users,
-    ensure_storage
+    create_broadcast_job,
+    get_broadcast_jobs,
+    get_user_count,
+    save_campaign,
+    set_campaign_active,
+    get_campaigns,
+    get_task_stats
 )
 
 # Load environment variables
@@ -34,16 +42,14 @@ load_dotenv()
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHANNEL_URL = os.getenv("CHANNEL_URL", "https://t.me/your_channel")
 ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID", "0"))
-BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "10"))
 
 # Channel forwarding configuration
 SOURCE_CHANNEL_ID = int(os.getenv("SOURCE_CHANNEL_ID", "0"))
 MSG_IMMEDIATE_ID = int(os.getenv("MSG_IMMEDIATE_ID", "0"))
 
-# Cache for /results command (to avoid rate limits)
-RESULTS_CACHE = None
-RESULTS_CACHE_TIME = 0
+# /results feed (one Telethon client for the whole process)
 RESULTS_CACHE_DURATION = int(os.getenv("RESULTS_CACHE_HOURS", "1")) * 3600  # Convert hours to seconds
+results_feed = ResultsFeed(RESULTS_CACHE_DURATION)
 
 
 # ===== COMMAND HANDLERS =====
@@ -62,22 +68,35 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.args:
         payload = " ".join(context.args)
     
-    # Check if user already exists
+    # User data, saved only if this chat_id is new
+    user_data = {
+        "chat_id": chat_id,
+        "user_id": user.id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "start_payload": payload,
+        "timestamp_utc": datetime.utcnow().isoformat(),
+        # Helper bot that got the /start; the worker sends to them from it
+        "bot_id": None if context.bot.token == BOT_TOKEN else context.bot.id
+    }
+    
+    # Insert-if-new on the users primary key doubles as the existence check;
+    # the user row and their drip tasks are written in one transaction
+    start_time = int(time.time())
     try:
-        users = get_all_users()
-        user_count = len(users)
-        existing_user = any(u.get("chat_id") == chat_id for u in users)
-        
-        print(f"📊 /start from user {user.id} (chat_id: {chat_id})")
-        print(f"   Total users in DB: {user_count}")
-        print(f"   Existing user: {existing_user}")
-        
+        task_ids = await register_user(user_data, start_time)
     except Exception as e:
+        # Never greet a possibly new user as returning; their drip is lost,
+        # but they still get the welcome message
         print(f"❌ Error checking user database: {e}")
         print(f"⚠️ Treating user {user.id} as new user due to database error")
-        existing_user = False
+        task_ids = []
     
-    if existing_user:
+    print(f"📊 /start from user {user.id} (chat_id: {chat_id})")
+    print(f"   Existing user: {task_ids is None}")
+    
+    if task_ids is None:
         # Returning user - show welcome back message with Join button
         keyboard = [[InlineKeyboardButton("🔥 Join Channel", url=CHANNEL_URL)]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -91,23 +110,6 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         print(f"✅ Returning user {user.id} used /start")
         return
     
-    # New user - save data and create tasks
-    user_data = {
-        "chat_id": chat_id,
-        "user_id": user.id,
-        "username": user.username,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "start_payload": payload,
-        "timestamp_utc": datetime.utcnow().isoformat()
-    }
-    
-    add_user(user_data)
-    
-    # Create scheduled tasks
-    start_time = int(time.time())
-    task_ids = create_user_tasks(chat_id, start_time)
-    
     print(f"✅ User {user.id} started bot. Created {len(task_ids)} tasks. Payload: {payload}")
     
     # Send immediate welcome message by copying from source channel (no "Forwarded from" tag)
@@ -140,7 +142,7 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     chat_id = update.effective_chat.id
     
-    cancelled_count = cancel_user_tasks(chat_id)
+    cancelled_count = await cancel_user_tasks(chat_id)
     
     await update.message.reply_text(
         f"✅ Unsubscribed successfully.\n"
@@ -232,149 +234,34 @@ async def about_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def results_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Handle /results command with caching.
-    Fetches latest 5 position status messages from @wazirforexalerts using Telethon.
-    Caches results based on RESULTS_CACHE_HOURS environment variable (default: 1 hour).
+    Handle /results command.
+    Shows the latest 5 position status messages from @wazirforexalerts,
+    served from the results feed (refreshed in the background every
+    RESULTS_CACHE_HOURS, see results_feed).
     """
-    global RESULTS_CACHE, RESULTS_CACHE_TIME
-    
     chat_id = update.effective_chat.id
     
-    try:
-        # Send "fetching" message
+    # Only the very first /results after startup has to wait for Telegram
+    status_msg = None
+    if not results_feed.ready:
         status_msg = await update.message.reply_text("📊 Fetching latest results...")
-        
-        # Check if cache is still valid
-        current_time = time.time()
-        if RESULTS_CACHE and (current_time - RESULTS_CACHE_TIME) < RESULTS_CACHE_DURATION:
-            # Serve from cache
-            await status_msg.edit_text(RESULTS_CACHE)
-            print(f"📊 User {chat_id} - served from cache (age: {int(current_time - RESULTS_CACHE_TIME)}s)")
-            return
-        
-        # Cache expired or doesn't exist - fetch fresh data
-        # Import Telethon async client (not sync)
-        try:
-            from telethon import TelegramClient  # Use async client
-        except ImportError:
-            await status_msg.edit_text(
-                "❌ Telethon not installed.\n\n"
-                "Run: `pip install telethon`"
-            )
-            return
-        
-        # Get API credentials from environment
-        api_id = os.getenv("TELEGRAM_API_ID")
-        api_hash = os.getenv("TELEGRAM_API_HASH")
-        phone = os.getenv("TELEGRAM_PHONE")
-        
-        if not api_id or not api_hash:
-            await status_msg.edit_text(
-                "❌ Missing Telethon credentials!\n\n"
-                "Add to .env:\n"
-                "TELEGRAM_API_ID=your_id\n"
-                "TELEGRAM_API_HASH=your_hash\n"
-                "TELEGRAM_PHONE=+1234567890\n\n"
-                "Get API credentials from: https://my.telegram.org"
-            )
-            return
-        
-        if not phone:
-            await status_msg.edit_text(
-                "❌ Missing phone number!\n\n"
-                "Add to .env:\n"
-                "TELEGRAM_PHONE=+1234567890\n\n"
-                "(Your personal Telegram phone number)"
-            )
-            return
-        
-        # Create Telethon async client
-        session_file = 'user_session'
-        client = TelegramClient(session_file, int(api_id), api_hash)
-        
-        try:
-            await client.connect()
-            
-            # Check if already authorized
-            if not await client.is_user_authorized():
-                await status_msg.edit_text(
-                    "⚠️ First-time setup required!\n\n"
-                    "Run: python setup_telethon.py\n"
-                    "Complete phone verification, then restart bot."
-                )
-                await client.disconnect()
-                return
-            
-            # Fetch messages from @wazirforexalerts
-            channel_username = 'wazirforexalerts'
-            position_updates = []
-            
-            async for message in client.iter_messages(channel_username, limit=100):
-                if not message.text:
-                    continue
-                
-                text = message.text
-                
-                # Filter: Must have "Position Status"
-                if "Position Status" not in text:
-                    continue
-                
-                # Filter: Must have "Take Profit" OR "Hit SL"
-                if not ("Take Profit" in text or "Hit SL" in text):
-                    continue
-                
-                # Clean the message
-                clean_text = text
-                clean_text = clean_text.replace("Any inquiries Dm @zubarekhan01", "")
-                clean_text = clean_text.replace("WAZIR FOREX ALERTS", "")
-                
-                # Remove extra blank lines
-                lines = [line.strip() for line in clean_text.split('\n') if line.strip()]
-                clean_text = '\n'.join(lines)
-                
-                # Add emoji based on result type
-                if "Take Profit" in clean_text:
-                    clean_text = "✅ " + clean_text
-                elif "Hit SL" in clean_text:
-                    clean_text = "❌ " + clean_text
-                
-                position_updates.append(clean_text)
-                
-                # Stop after 5 valid messages
-                if len(position_updates) >= 5:
-                    break
-            
-            await client.disconnect()
-            
-            if not position_updates:
-                await status_msg.edit_text("⚠️ No position status updates found.")
-                return
-            
-            # Format with separators
-            separator = "\n" + "─" * 30 + "\n\n"
-            final_message = separator.join(position_updates)
-            final_message = f"📊 **Latest Trading Results**\n{separator}{final_message}"
-            
-            # Update cache
-            RESULTS_CACHE = final_message
-            RESULTS_CACHE_TIME = current_time
-            
-            # Send formatted results
-            await status_msg.edit_text(final_message)
-            print(f"📊 User {chat_id} - fetched fresh data, cached for 5min ({len(position_updates)} results)")
-            
-        except Exception as e:
-            await client.disconnect()
-            raise e
-        
+    
+    try:
+        text = await results_feed.get()
+        print(f"📊 User {chat_id} - served results")
+    except ResultsUnavailable as e:
+        text = str(e)
     except Exception as e:
         print(f"❌ Error fetching results: {e}")
-        await update.message.reply_text(
+        text = (
             f"❌ Error: {str(e)}\n\n"
             "Make sure Telethon is configured correctly with your phone number."
         )
-
-
+    
+    if status_msg is not None:
+        await status_msg.edit_text(text)
+    else:
+        await update.message.reply_text(text)
 
 
 async def send_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -395,8 +282,11 @@ async def send_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "**To broadcast a message:**\n"
         f"1. Go to your source channel (ID: {SOURCE_CHANNEL_ID})\n"
         "2. Post a message starting with `/chat`\n"
-        "3. The bot will automatically forward it to all users in batches\n\n"
-        "Example: `/chat Hello everyone! New update!`",
+        "3. The worker will send it to all users in batches, without `/chat` and its filters\n\n"
+        "Example: `/chat Hello everyone! New update!`\n\n"
+        "**To target a segment**, put filters right after `/chat`:\n"
+        "`payload=PREFIX` `since=YYYY-MM-DD` `until=YYYY-MM-DD` `all`\n"
+        "Example: `/chat payload=fb_ since=2025-01-01 New update!`",
         parse_mode="Markdown"
     )
 
@@ -423,66 +313,35 @@ async def handle_broadcast_message(update: Update, context: ContextTypes.DEFAULT
     context.user_data["awaiting_broadcast"] = False
     
     message = update.message
-    users = get_all_users()
     
-    if not users:
+    # Only this (primary) bot can see the message, so only its users get it
+    segment = {"bot_id": 0}
+    user_count = await get_user_count(reachable_only=True, segment=segment)
+    
+    if not user_count:
         await message.reply_text("⚠️ No users to broadcast to.")
         return
     
-    # Send "processing" message
-    status_msg = await message.reply_text(
-        f"📤 Broadcasting to {len(users)} users...\n"
-        f"Please wait..."
-    )
+    # The worker runs the job; progress survives restarts of either process
+    job_id = await create_broadcast_job("forward", message.chat_id, message.message_id, segment)
     
-    success_count = 0
-    fail_count = 0
-    blocked_count = 0
+    if not job_id:
+        await message.reply_text("❌ Could not queue the broadcast, please try again.")
+        return
     
-    # Process in batches
-    for i in range(0, len(users), BROADCAST_BATCH_SIZE):
-        batch = users[i:i+BROADCAST_BATCH_SIZE]
-        
-        # Forward to all users in batch simultaneously
-        results = await asyncio.gather(*[
-            message.forward(chat_id=user["chat_id"])
-            for user in batch
-        ], return_exceptions=True)
-        
-        # Count successes/failures
-        for result in results:
-            if isinstance(result, Exception):
-                error_msg = str(result)
-                if "blocked" in error_msg.lower() or "user is deactivated" in error_msg.lower():
-                    blocked_count += 1
-                else:
-                    fail_count += 1
-            else:
-                success_count += 1
-        
-        # Small delay between batches to respect rate limits
-        if i + BROADCAST_BATCH_SIZE < len(users):
-            await asyncio.sleep(0.5)
-    
-    # Report results to admin
-    result_text = (
-        f"✅ *Broadcast Complete!*\n\n"
-        f"📊 Results:\n"
-        f"✅ Sent: {success_count}\n"
-        f"🚫 Blocked/Deactivated: {blocked_count}\n"
-        f"❌ Failed: {fail_count}\n"
-        f"📈 Total users: {len(users)}"
+    await message.reply_text(
+        f"📤 Broadcast #{job_id} queued for {user_count} users.\n"
+        f"Use /stats to follow its progress."
     )
     
-    await status_msg.edit_text(result_text, parse_mode="Markdown")
-    
-    print(f"📢 Broadcast completed: {success_count} sent, {blocked_count} blocked, {fail_count} failed")
+    print(f"📢 Broadcast #{job_id} queued for {user_count} users")
 
 
 async def handle_chat_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handle messages from source channel that start with /chat.
-    Automatically broadcast them to all users.
+    Automatically broadcast them to all users, or to the segment given by
+    filters right after /chat (see broadcast.parse_segment).
     """
     # Only process channel posts from source channel
     if not update.channel_post:
@@ -500,51 +359,34 @@ async def handle_chat_broadcast(update: Update, context: ContextTypes.DEFAULT_TY
     
     print(f"📢 Broadcast triggered from channel: {text[:50]}...")
     
-    users = get_all_users()
-    
-    if not users:
-        print("⚠️ No users to broadcast to")
+    try:
+        segment, start = parse_segment(text)
+    except SegmentError as e:
+        # Never fall back to everyone when the intended audience is unclear
+        print(f"❌ Broadcast not queued, bad segment filter: {e}")
         return
     
-    success_count = 0
-    fail_count = 0
-    blocked_count = 0
+    # Users get the post without "/chat" and its filters (internal targeting)
+    if message.text:
+        mode = "text"
+        body, entities = strip_command(text, message.entities, start)
+        if not body:
+            print("❌ Broadcast not queued: the post has no text after /chat")
+            return
+    else:
+        mode = "copy"
+        body, entities = strip_command(text, message.caption_entities, start)
     
-    # Process in batches
-    for i in range(0, len(users), BROADCAST_BATCH_SIZE):
-        batch = users[i:i+BROADCAST_BATCH_SIZE]
-        
-        # Copy to all users in batch simultaneously (no "Forwarded from" tag)
-        # Create "Join Now" button for each message
-        keyboard = [[InlineKeyboardButton("⚡ Join Now", url=CHANNEL_URL)]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        results = await asyncio.gather(*[
-            context.bot.copy_message(
-                chat_id=user["chat_id"],
-                from_chat_id=SOURCE_CHANNEL_ID,
-                message_id=message.message_id,
-                reply_markup=reply_markup
-            )
-            for user in batch
-        ], return_exceptions=True)
-        
-        # Count successes/failures
-        for result in results:
-            if isinstance(result, Exception):
-                error_msg = str(result)
-                if "blocked" in error_msg.lower() or "user is deactivated" in error_msg.lower():
-                    blocked_count += 1
-                else:
-                    fail_count += 1
-            else:
-                success_count += 1
-        
-        # Small delay between batches
-        if i + BROADCAST_BATCH_SIZE < len(users):
-            await asyncio.sleep(0.5)
+    audience = await get_user_count(not segment.get("all"), segment)
+    if not audience:
+        print(f"⚠️ No users to broadcast to ({describe_segment(segment)})")
+        return
+    
+    # Sent by the worker (no "Forwarded from" tag) with a "Join Now" button
+    job_id = await create_broadcast_job(mode, SOURCE_CHANNEL_ID, message.message_id, segment, body, entities)
     
-    print(f"📢 Broadcast complete: {success_count} sent, {blocked_count} blocked, {fail_count} failed")
+    if job_id:
+        print(f"📢 Broadcast #{job_id} queued for {audience} users ({describe_segment(segment)})")
 
 
 async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -600,27 +442,113 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ This command is admin-only.")
         return
     
-    from utils import get_user_count, get_task_stats
-    
-    user_count = get_user_count()
-    task_stats = get_task_stats()
+    user_count = await get_user_count()
+    reachable_count = await get_user_count(reachable_only=True)
+    task_stats = await get_task_stats()
+    jobs = await get_broadcast_jobs()
     
     stats_text = (
         f"📊 *Bot Statistics*\n\n"
-        f"👥 Total Users: {user_count}\n\n"
+        f"👥 Total Users: {user_count}\n"
+        f"📬 Reachable: {reachable_count}\n\n"
         f"📋 Tasks:\n"
         f"• Pending: {task_stats['pending']}\n"
         f"• Sent: {task_stats['sent']}\n"
         f"• Failed: {task_stats['failed']}\n"
         f"• Cancelled: {task_stats['cancelled']}\n"
+        f"• Expired: {task_stats['expired']}\n"
         f"• Total: {task_stats['total']}"
     )
     
+    if jobs:
+        stats_text += "\n\n📢 Broadcasts:"
+        for job in jobs:
+            stats_text += (
+                f"\n• #{job['id']} {job['status']} `{describe_segment(job['segment'])}`: {job['sent']} sent, "
+                f"{job['blocked']} blocked, {job['failed']} failed"
+            )
+            if job['rate']:
+                stats_text += f" ({job['rate']:.1f} msg/s)"
+    
     await update.message.reply_text(stats_text, parse_mode="Markdown")
 
 
+async def campaign_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle /campaign command (admin only).
+    /campaign                        list campaigns
+    /campaign NAME PREFIX STEPS...   create or replace a campaign (see campaigns.parse_campaign)
+    /campaign NAME off|on            switch a campaign off or back on
+    Changes apply to the next /start without a restart.
+    """
+    user_id = update.effective_user.id
+    
+    if user_id != ADMIN_USER_ID:
+        await update.message.reply_text("⛔ This command is admin-only.")
+        return
+    
+    args = context.args or []
+    
+    if not args:
+        campaigns = await get_campaigns()
+        lines = [describe_campaign(campaign) for campaign in campaigns] or ["No campaigns yet."]
+        await update.message.reply_text(
+            "📋 Campaigns (name, payload prefix, delay:message)\n\n" + "\n".join(lines) + "\n\n"
+            "Create or replace: /campaign NAME PREFIX 30s:101 3m:102 2h:103\n"
+            "Switch off or on: /campaign NAME off"
+        )
+        return
+    
+    if len(args) == 2 and args[1] in ("off", "on"):
+        if await set_campaign_active(args[0], args[1] == "on"):
+            await update.message.reply_text(f"✅ Campaign {args[0]} is {args[1]}.")
+        else:
+            await update.message.reply_text(f"⚠️ No campaign named {args[0]}.")
+        return
+    
+    if not SOURCE_CHANNEL_ID:
+        await update.message.reply_text("⚠️ SOURCE_CHANNEL_ID is not set, campaign messages can not be copied.")
+        return
+    
+    try:
+        campaign = parse_campaign(update.message.text, SOURCE_CHANNEL_ID)
+    except CampaignError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    
+    for other in await get_campaigns(active_only=True):
+        if other["name"] != campaign["name"] and campaign["start_payload"] and other["start_payload"] == campaign["start_payload"]:
+            await update.message.reply_text(
+                f"❌ Campaign {other['name']} already uses payload prefix {campaign['start_payload']}."
+            )
+            return
+    
+    if await save_campaign(campaign["name"], campaign["start_payload"], campaign["steps"]) is None:
+        await update.message.reply_text("❌ Could not save the campaign, please try again.")
+        return
+    
+    await update.message.reply_text(
+        f"✅ Campaign {campaign['name']} saved with {len(campaign['steps'])} steps.\n"
+        f"New users with a matching payload get it from now on."
+    )
+    print(f"📋 Campaign saved: {campaign['name']} ({len(campaign['steps'])} steps)")
+
+
 # ===== MAIN =====
 
+def add_user_handlers(app):
+    """Register the user-facing handlers (shared by the primary and helper bots)."""
+    app.add_handler(CommandHandler("start", start_command))
+    app.add_handler(CommandHandler("stop", stop_command))
+    app.add_handler(CommandHandler("faq", faq_command))
+    app.add_handler(CommandHandler("about", about_command))
+    app.add_handler(CommandHandler("results", results_command))
+    app.add_handler(CommandHandler("help", help_command))
+    
+    # Add callback query handler for button clicks
+    app.add_handler(CallbackQueryHandler(button_callback_handler))
+
+
 def main():
     """Start the bot."""
     
@@ -659,23 +587,51 @@ def main():
     print(f"📁 Storage directory: {os.path.abspath('storage')}")
     print(f"👤 Admin user ID: {ADMIN_USER_ID}")
     print(f"📡 Source channel ID: {SOURCE_CHANNEL_ID}")
-    print(f"📢 Broadcast batch size: {BROADCAST_BATCH_SIZE}")
+    
+    helper_tokens = load_tokens()[1:]
+    if helper_tokens:
+        print(f"🤝 Helper bots: {len(helper_tokens)}")
+    
+    # Helper bots answer users who started them; the primary bot starts and stops
+    # them, together with the /results feed
+    helper_apps = []
+    for token in helper_tokens:
+        helper_app = ApplicationBuilder().token(token).build()
+        add_user_handlers(helper_app)
+        helper_apps.append(helper_app)
+    
+    async def post_init(application):
+        await results_feed.start()
+        
+        for helper_app in helper_apps:
+            await helper_app.initialize()
+            await helper_app.start()
+            await helper_app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            print(f"✅ Helper bot @{helper_app.bot.username} is running")
+    
+    async def post_shutdown(application):
+        for helper_app in helper_apps:
+            if helper_app.running:
+                await helper_app.updater.stop()
+                await helper_app.stop()
+            await helper_app.shutdown()
+        
+        await results_feed.stop()
     
     # Build application
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Add command handlers
-    app.add_handler(CommandHandler("start", start_command))
-    app.add_handler(CommandHandler("stop", stop_command))
-    app.add_handler(CommandHandler("faq", faq_command))
-    app.add_handler(CommandHandler("about", about_command))
-    app.add_handler(CommandHandler("results", results_command))
+    add_user_handlers(app)
     app.add_handler(CommandHandler("send", send_command))
-    app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("stats", stats_command))
-    
-    # Add callback query handler for button clicks
-    app.add_handler(CallbackQueryHandler(button_callback_handler))
+    app.add_handler(CommandHandler("campaign", campaign_command))
     
     # Add channel post handler for /chat broadcasts
     app.add_handler(MessageHandler(
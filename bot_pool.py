@@ -0,0 +1,111 @@
+"""
+Sending bot pool
+The primary bot (TELEGRAM_BOT_TOKEN) plus optional helper bots
+(HELPER_BOT_TOKENS). A user can only be messaged by a bot they have started,
+so every chat is sent to by the bot recorded in users.bot_id (NULL = primary
+bot). Each bot has its own rate limiter, so capacity grows with the pool.
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot
+
+from rate_limiter import RateLimiter
+
+
+class BotNotConfigured(LookupError):
+    """A user's helper bot is no longer in HELPER_BOT_TOKENS."""
+
+
+def load_tokens() -> List[str]:
+    """
+    Bot tokens from the environment, primary bot first.
+
+    Returns:
+        [TELEGRAM_BOT_TOKEN, *HELPER_BOT_TOKENS] without blanks or duplicates,
+        or an empty list if TELEGRAM_BOT_TOKEN is not set
+    """
+    primary = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not primary:
+        return []
+
+    tokens = [primary]
+    for token in os.getenv("HELPER_BOT_TOKENS", "").split(","):
+        token = token.strip()
+        if token and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def bot_id_from_token(token: str) -> int:
+    """The bot's user ID, which is the part of its token before the colon."""
+    return int(token.split(":", 1)[0])
+
+
+class BotPool:
+    """Bots and their rate limiters, looked up by a user's bot_id."""
+
+    def __init__(self, tokens: List[str]):
+        self.primary_id = bot_id_from_token(tokens[0])
+        self._bots: Dict[int, Tuple[Bot, RateLimiter]] = {}
+        for token in tokens:
+            self._bots[bot_id_from_token(token)] = (Bot(token=token), RateLimiter())
+
+    def __len__(self) -> int:
+        return len(self._bots)
+
+    @property
+    def primary(self) -> Bot:
+        return self._bots[self.primary_id][0]
+
+    @property
+    def limiters(self) -> List[RateLimiter]:
+        return [limiter for _, limiter in self._bots.values()]
+
+    def get(self, bot_id: Optional[int]) -> Tuple[Bot, RateLimiter]:
+        """
+        Bot and limiter to send to a user with.
+
+        Users of the primary bot (bot_id None or 0) get the primary bot. A
+        helper's users can only be messaged by that helper (any other bot
+        gets Forbidden, which would mark them unreachable), so there is no
+        fallback for a helper that is no longer configured.
+
+        Raises:
+            BotNotConfigured: The user's helper bot is not in the pool
+        """
+        bot = self._bots.get(bot_id or self.primary_id)
+        if bot is None:
+            raise BotNotConfigured(f"bot {bot_id} is not configured")
+        return bot
+
+    async def connect(self) -> bool:
+        """Check every token with get_me; False if any of them fails."""
+        ok = True
+        for bot_id, (bot, _) in self._bots.items():
+            try:
+                bot_info = await bot.get_me()
+                role = "primary" if bot_id == self.primary_id else "helper"
+                print(f"✅ Connected as @{bot_info.username} ({role})")
+            except Exception as e:
+                print(f"❌ Could not connect bot {bot_id} to Telegram: {e}")
+                ok = False
+        return ok
+
+    async def check_source_chat(self, chat_id: int) -> bool:
+        """
+        Check that every bot can read the channel messages are copied from.
+
+        A bot without access gets "chat not found" for every copy, so this
+        is caught at startup instead of failing each send.
+        """
+        ok = True
+        for bot_id, (bot, _) in self._bots.items():
+            try:
+                await bot.get_chat(chat_id)
+            except Exception as e:
+                print(f"❌ Bot {bot_id} can not access source channel {chat_id}: {e}")
+                print("   Add it to the channel as an admin, or check SOURCE_CHANNEL_ID")
+                ok = False
+        return ok
@@ -0,0 +1,401 @@
+"""
+Broadcast engine - runs queued broadcast jobs inside the worker process
+Jobs are rows in broadcast_jobs; progress is committed after every batch,
+so a job interrupted by a crash or restart resumes after its last batch.
+The send rate and batch size (send concurrency) adapt to Telegram's
+responses with AIMD.
+"""
+
+import os
+import re
+import time
+import asyncio
+from datetime import datetime
+from statistics import median
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, MessageEntity
+from telegram.error import RetryAfter
+
+from async_storage import (
+    claim_broadcast_job,
+    get_broadcast_recipients,
+    update_broadcast_progress,
+    renew_broadcast_lease,
+    finish_broadcast_job
+)
+from bot_pool import BotPool
+from send_errors import is_chat_unreachable
+
+BROADCAST_LEASE_SECONDS = 120  # Renewed after every batch and by a heartbeat during slow ones
+LEASE_RENEW_INTERVAL = 30  # Seconds between heartbeat renewals while a job runs
+MAX_FLOOD_RETRIES = 3  # RetryAfter retries per recipient before counting a failure
+PROGRESS_LOG_INTERVAL = 30  # Seconds between progress lines
+
+# AIMD tuning: +1 concurrent send per clean batch, cut on FloodWait or slow batches
+MIN_CONCURRENCY = 1
+DECREASE_FACTOR = 0.5
+LATENCY_TOLERANCE = 2.0  # A batch is "slow" above this multiple of the baseline latency
+BASELINE_DRIFT = 0.05  # How fast the baseline follows latency upwards
+
+# AIMD tuning of the per-bot send rate: +1 msg/s per batch without a FloodWait
+# (up to RATE_LIMIT_GLOBAL), halved on a FloodWait
+MIN_RATE = 1.0
+RATE_INCREASE = 1.0
+
+
+class SegmentError(ValueError):
+    """A /chat segment filter that can not be parsed."""
+
+
+def parse_segment(text: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Parse the audience filters following /chat.
+
+    Filters are leading words of the post, e.g.
+    "/chat payload=fb_ since=2025-01-01 until=2025-01-31 all Hello!":
+        payload=PREFIX   users whose start payload starts with PREFIX
+        since=YYYY-MM-DD users who started on or after this date (UTC)
+        until=YYYY-MM-DD users who started on or before this date (UTC)
+        all              include users marked unreachable
+    Parsing stops at the first word that is not a filter.
+
+    Returns:
+        (segment dictionary (empty = every reachable user), index in text
+        where the post's own text starts, after /chat and the filters)
+
+    Raises:
+        SegmentError: A filter has an empty value or an invalid date
+    """
+    segment: Dict[str, Any] = {}
+    words = list(re.finditer(r"\S+", text))[1:]
+
+    for match in words:
+        word = match.group()
+        if word == "all":
+            segment["all"] = True
+            continue
+
+        key, sep, value = word.partition("=")
+        if not sep or key not in ("payload", "since", "until"):
+            return segment, match.start()
+
+        if not value:
+            raise SegmentError(f"Empty value for {key}=")
+
+        if key in ("since", "until"):
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise SegmentError(f"Invalid date {value!r} for {key}= (expected YYYY-MM-DD)")
+
+        segment[key] = value
+
+    return segment, len(text)
+
+
+def strip_command(text: str, entities: List[MessageEntity], start: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Drop the /chat command and its filters from a post, keeping its formatting.
+
+    Users must only see the post's own text, not internal targeting. Entity
+    offsets count UTF-16 code units, so they are shifted by the UTF-16
+    length of the removed header; entities inside it (the bot command) are
+    dropped.
+
+    Args:
+        text: Text or caption of the post
+        entities: Its entities (message.entities or caption_entities)
+        start: Where the post's own text starts (see parse_segment)
+
+    Returns:
+        (remaining text, its entities as dictionaries for the job row)
+    """
+    cut = len(text[:start].encode("utf-16-le")) // 2
+    kept = []
+    for entity in entities:
+        end = entity.offset + entity.length
+        if end <= cut:
+            continue
+        data = entity.to_dict()
+        data["offset"] = max(entity.offset - cut, 0)
+        data["length"] = end - cut - data["offset"]
+        kept.append(data)
+    return text[start:], kept
+
+
+def describe_segment(segment: Dict[str, Any]) -> str:
+    """Short human-readable form of a segment for logs and /stats."""
+    parts = []
+    if segment.get("payload"):
+        parts.append(f"payload {segment['payload']}*")
+    if segment.get("since"):
+        parts.append(f"since {segment['since']}")
+    if segment.get("until"):
+        parts.append(f"until {segment['until']}")
+    if segment.get("all"):
+        parts.append("incl. unreachable")
+    return ", ".join(parts) or "all reachable users"
+
+
+class AdaptiveConcurrency:
+    """
+    Additive-increase / multiplicative-decrease limit on concurrent sends.
+
+    Every clean batch raises the limit by one; a FloodWait or a batch whose
+    median latency is well above the baseline halves it. The baseline is
+    the lowest latency seen, drifting slowly upwards so a lasting change in
+    network conditions is not mistaken for overload forever.
+    """
+
+    def __init__(self, initial: int, maximum: int):
+        self.maximum = max(MIN_CONCURRENCY, maximum)
+        self.limit = max(MIN_CONCURRENCY, min(initial, self.maximum))
+        self._baseline: Optional[float] = None
+
+    def update(self, flooded: bool, latency: Optional[float]):
+        """
+        Adjust the limit after a batch.
+
+        Args:
+            flooded: True if any send in the batch got a RetryAfter
+            latency: Median API latency of the batch's sends (None if none succeeded)
+        """
+        if flooded:
+            self._decrease()
+            return
+
+        if latency is None:
+            return
+
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        else:
+            self._baseline += (latency - self._baseline) * BASELINE_DRIFT
+
+        if latency > self._baseline * LATENCY_TOLERANCE:
+            self._decrease()
+        else:
+            self.limit = min(self.maximum, self.limit + 1)
+
+    def _decrease(self):
+        self.limit = max(MIN_CONCURRENCY, int(self.limit * DECREASE_FACTOR))
+
+
+class AdaptiveRate:
+    """
+    Additive-increase / multiplicative-decrease send rate per bot.
+
+    The rate limiters, not the batch size, set how fast messages go out
+    (a batch is usually larger than rate x latency), so backing off means
+    lowering the limiters' global rate. Every batch without a FloodWait
+    raises the rate by RATE_INCREASE; a FloodWait halves it.
+    """
+
+    def __init__(self, initial: float, maximum: float):
+        self.maximum = max(MIN_RATE, maximum)
+        self.rate = max(MIN_RATE, min(initial, self.maximum))
+
+    def update(self, flooded: bool):
+        """Adjust the rate after a batch (flooded: any send got a RetryAfter)."""
+        if flooded:
+            self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+        else:
+            self.rate = min(self.maximum, self.rate + RATE_INCREASE)
+
+
+class BroadcastRunner:
+    """Claims broadcast jobs and sends them to every reachable user."""
+
+    def __init__(self, pool: BotPool, owner: str):
+        self.pool = pool
+        self.owner = owner
+        # Read here rather than at import, after the worker's load_dotenv
+        self.channel_url = os.getenv("CHANNEL_URL", "https://t.me/your_channel")
+        # Starting and maximum number of users sent to simultaneously (per bot)
+        self.initial_concurrency = int(os.getenv("BROADCAST_BATCH_SIZE", "10"))
+        self.max_concurrency = int(os.getenv("BROADCAST_MAX_CONCURRENCY", "100"))
+        self._wake = asyncio.Event()
+        # Per-batch measurements filled in by _send
+        self._latencies: List[float] = []
+        self._flooded = False
+
+    def wake(self):
+        """Called when bot.py queues a new job."""
+        self._wake.set()
+
+    async def run_forever(self, max_idle: float):
+        """Run jobs one after another; sleep until woken when there are none."""
+        while True:
+            try:
+                job = await claim_broadcast_job(self.owner, BROADCAST_LEASE_SECONDS)
+                if job is not None:
+                    await self.run_job(job)
+                    continue
+            except Exception as e:
+                print(f"❌ Broadcast error: {e}")
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max_idle)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_job(self, job: dict):
+        """Send a job to every user of its segment after its cursor."""
+        job_id = job["id"]
+        segment = job["segment"]
+        reachable_only = not segment.get("all")
+        cursor: Optional[int] = job["cursor"]
+        sent, blocked, failed = job["sent"], job["blocked"], job["failed"]
+        last_log = time.time()
+
+        # A resumed job starts from the concurrency it had settled on
+        concurrency = AdaptiveConcurrency(
+            job.get("concurrency") or self.initial_concurrency * len(self.pool),
+            self.max_concurrency * len(self.pool)
+        )
+        # Per-bot rate, applied to every bot's limiter; jobs store the total
+        max_rate = min(limiter.max_rate for limiter in self.pool.limiters)
+        rate = AdaptiveRate((job.get("rate") or max_rate * len(self.pool)) / len(self.pool), max_rate)
+        self._apply_rate(rate.rate)
+
+        if cursor is None:
+            print(f"📢 Broadcast #{job_id} started ({describe_segment(segment)})")
+        else:
+            print(f"📢 Broadcast #{job_id} resuming after chat {cursor} ({sent} already sent)")
+
+        # A batch can wait out FloodWaits far longer than the lease
+        heartbeat = asyncio.create_task(self._keep_lease(job_id))
+        try:
+            while True:
+                batch, bot_ids = await get_broadcast_recipients(
+                    cursor, concurrency.limit, reachable_only, segment
+                )
+                if not batch:
+                    break
+
+                # Send to all users in batch simultaneously (paced by the rate limiter)
+                self._latencies = []
+                self._flooded = False
+                sends = asyncio.gather(*[
+                    self._send(job, chat_id, bot_id)
+                    for chat_id, bot_id in zip(batch, bot_ids)
+                ], return_exceptions=True)
+                await asyncio.wait([sends, heartbeat], return_when=asyncio.FIRST_COMPLETED)
+                if not sends.done():
+                    # Lease lost mid-batch: another worker owns the job now
+                    sends.cancel()
+                    print(f"⚠️ Broadcast #{job_id}: lease lost, stopping (the new owner resumes it)")
+                    return
+                results = sends.result()
+
+                # Count successes/failures
+                batch_sent, batch_failed = 0, 0
+                dead_chats = []
+                for chat_id, result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        if is_chat_unreachable(result):
+                            dead_chats.append(chat_id)
+                        else:
+                            batch_failed += 1
+                    else:
+                        batch_sent += 1
+
+                # Tune the send rate and concurrency for the next batch
+                rate.update(self._flooded)
+                self._apply_rate(rate.rate)
+                concurrency.update(self._flooded, median(self._latencies) if self._latencies else None)
+
+                # Commit progress before moving on, so a restart resumes here
+                cursor = batch[-1]
+                if not await update_broadcast_progress(
+                    job_id, self.owner, cursor, batch_sent, len(dead_chats), batch_failed,
+                    list(dead_chats), BROADCAST_LEASE_SECONDS, concurrency.limit, rate.rate * len(self.pool)
+                ):
+                    print(f"⚠️ Broadcast #{job_id}: lease lost, stopping (the new owner resumes it)")
+                    return
+                sent += batch_sent
+                blocked += len(dead_chats)
+                failed += batch_failed
+
+                if time.time() - last_log >= PROGRESS_LOG_INTERVAL:
+                    print(f"📢 Broadcast #{job_id}: {sent} sent, {blocked} blocked, {failed} failed so far "
+                          f"(concurrency {concurrency.limit}, {rate.rate * len(self.pool):.1f} msg/s)")
+                    last_log = time.time()
+
+            if not await finish_broadcast_job(job_id, self.owner):
+                print(f"⚠️ Broadcast #{job_id}: lease lost before it could be marked done")
+                return
+            print(f"📢 Broadcast #{job_id} complete: {sent} sent, {blocked} blocked, {failed} failed "
+                  f"(settled at concurrency {concurrency.limit}, {rate.rate * len(self.pool):.1f} msg/s)")
+        finally:
+            heartbeat.cancel()
+            # Scheduled messages go back to the full rate
+            for limiter in self.pool.limiters:
+                limiter.reset_rate()
+
+    def _apply_rate(self, rate: float):
+        for limiter in self.pool.limiters:
+            limiter.set_rate(rate)
+
+    async def _keep_lease(self, job_id: int):
+        """Renew the job's lease until cancelled; returns if the lease was lost."""
+        while True:
+            await asyncio.sleep(LEASE_RENEW_INTERVAL)
+            if not await renew_broadcast_lease(job_id, self.owner, BROADCAST_LEASE_SECONDS):
+                return
+
+    async def _send(self, job: dict, chat_id: int, bot_id: int):
+        """
+        Send one recipient's copy from their bot, waiting out FloodWaits.
+
+        A FloodWait pauses the whole bot. Records the API latency of a
+        successful send (rate limiter waits excluded) and whether a FloodWait
+        was seen, for AdaptiveRate and AdaptiveConcurrency.
+        """
+        bot, limiter = self.pool.get(bot_id)
+        join_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⚡ Join Now", url=self.channel_url)]])
+        # Text or caption replacing the post's own (its /chat header removed)
+        entities = MessageEntity.de_list(job["entities"], bot) if job["text"] is not None else None
+
+        for attempt in range(MAX_FLOOD_RETRIES + 1):
+            await limiter.acquire(chat_id)
+            started = time.monotonic()
+            try:
+                if job["mode"] == "forward":
+                    result = await bot.forward_message(
+                        chat_id=chat_id,
+                        from_chat_id=job["from_chat_id"],
+                        message_id=job["message_id"]
+                    )
+                elif job["mode"] == "text":
+                    # The post's text without its /chat header, with "Join Now" button
+                    result = await bot.send_message(
+                        chat_id=chat_id,
+                        text=job["text"],
+                        entities=entities,
+                        reply_markup=join_markup
+                    )
+                else:
+                    # Copy (no "Forwarded from" tag) with "Join Now" button; a
+                    # /chat media post gets its caption without the header
+                    result = await bot.copy_message(
+                        chat_id=chat_id,
+                        from_chat_id=job["from_chat_id"],
+                        message_id=job["message_id"],
+                        caption=job["text"],
+                        caption_entities=entities,
+                        reply_markup=join_markup
+                    )
+            except RetryAfter as e:
+                self._flooded = True
+                if attempt == MAX_FLOOD_RETRIES:
+                    raise
+                # Slow the whole bot, not just this chat
+                limiter.pause(int(e.retry_after) + 1)
+                limiter.defer(chat_id, int(e.retry_after) + 1)
+                continue
+
+            self._latencies.append(time.monotonic() - started)
+            return result
@@ -0,0 +1,169 @@
+"""
+Drip campaigns - which scheduled messages a new user gets
+Campaigns and their steps live in SQLite (campaigns, campaign_steps). A
+user gets the active campaign whose start_payload is the longest prefix of
+their /start deep-link payload, or the default campaign (MSG_*_ID).
+
+The bot compiles the campaigns into an in-memory lookup and reloads it only
+when the campaigns version in meta changes (bumped by triggers on both
+tables), so a /start costs one primary-key read instead of a schedule parse.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import DEFAULT_CAMPAIGN, get_campaign_version, get_campaigns
+
+# Seconds per duration suffix in /campaign steps
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Freshness window of a step without an explicit one: three times its delay,
+# at least 15 minutes (matches the default campaign's 30s and 2h steps)
+MIN_LATENESS = 15 * 60
+LATENESS_FACTOR = 3
+
+
+class CampaignError(ValueError):
+    """A /campaign definition that can not be parsed."""
+
+
+def parse_duration(text: str) -> int:
+    """
+    Parse a duration like "30s", "3m", "2h" or "1d" into seconds.
+
+    Raises:
+        CampaignError: Not a number followed by s, m, h or d
+    """
+    unit = DURATION_UNITS.get(text[-1:])
+    if unit is None or not text[:-1].isdigit():
+        raise CampaignError(f"Invalid duration {text!r} (expected e.g. 30s, 3m, 2h, 1d)")
+    return int(text[:-1]) * unit
+
+
+def format_duration(seconds: int) -> str:
+    """Shortest exact form of a duration, e.g. 7200 -> "2h"."""
+    for suffix, unit in sorted(DURATION_UNITS.items(), key=lambda item: -item[1]):
+        if seconds and seconds % unit == 0:
+            return f"{seconds // unit}{suffix}"
+    return f"{seconds}s"
+
+
+def default_lateness(delay: int) -> int:
+    """Freshness window for a step that does not set one."""
+    return max(MIN_LATENESS, delay * LATENESS_FACTOR)
+
+
+def parse_campaign(text: str, source_channel_id: int) -> Dict[str, Any]:
+    """
+    Parse a campaign definition from the /campaign admin command.
+
+    "/campaign fb_summer fb_sum 30s:101 3m:102 2h:103/6h":
+        fb_summer        campaign name
+        fb_sum           start payload prefix that selects it ("-" for the
+                         default campaign, which has none)
+        DELAY:MESSAGE_ID a step copying MESSAGE_ID from the source channel
+                         DELAY after /start, optionally /MAX_LATENESS
+                         (default: see default_lateness)
+
+    Returns:
+        Dictionary with name, start_payload and steps (schedule items)
+
+    Raises:
+        CampaignError: The definition is incomplete or a step is invalid
+    """
+    words = text.split()[1:]
+    if len(words) < 3:
+        raise CampaignError("Usage: /campaign NAME PAYLOAD_PREFIX DELAY:MESSAGE_ID[/MAX_LATENESS] ...")
+
+    name, start_payload = words[0], words[1]
+    if start_payload == "-":
+        if name != DEFAULT_CAMPAIGN:
+            raise CampaignError(f"Only the {DEFAULT_CAMPAIGN} campaign can have no payload prefix")
+        start_payload = None
+    elif name == DEFAULT_CAMPAIGN:
+        raise CampaignError(f"The {DEFAULT_CAMPAIGN} campaign can not have a payload prefix, use -")
+
+    steps = []
+    for position, word in enumerate(words[2:], start=1):
+        timing, sep, message = word.partition(":")
+        message_id, _, lateness = message.partition("/")
+        if not sep or not message_id.isdigit() or int(message_id) <= 0:
+            raise CampaignError(f"Invalid step {word!r} (expected DELAY:MESSAGE_ID, e.g. 30s:101)")
+
+        delay = parse_duration(timing)
+        steps.append({
+            "type": f"step{position}",
+            "delay": delay,
+            "max_lateness": parse_duration(lateness) if lateness else default_lateness(delay),
+            "source_channel_id": source_channel_id,
+            "message_id": int(message_id),
+            "check_membership": False
+        })
+
+    if len({step["delay"] for step in steps}) != len(steps):
+        raise CampaignError("Two steps have the same delay")
+
+    return {"name": name, "start_payload": start_payload, "steps": steps}
+
+
+def describe_campaign(campaign: Dict[str, Any]) -> str:
+    """One-line summary of a campaign for /campaign."""
+    steps = " ".join(
+        f"{format_duration(step['delay'])}:{step['message_id']}" for step in campaign["steps"]
+    )
+    prefix = f"{campaign['start_payload']}*" if campaign["start_payload"] else "-"
+    state = "" if campaign["active"] else " (off)"
+    return f"{campaign['name']} {prefix}{state}: {steps or 'no steps'}"
+
+
+class CampaignSchedule:
+    """
+    Compiled campaigns: start payload -> [(step_id, delay), ...].
+
+    Used from the single database thread (see async_storage.run_db), so
+    the compiled lookup needs no locking.
+    """
+
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._by_payload: Dict[str, List[Tuple[int, int]]] = {}
+        self._default: List[Tuple[int, int]] = []
+        self._longest_prefix = 0
+
+    def steps_for(self, start_payload: Optional[str]) -> List[Tuple[int, int]]:
+        """
+        Steps of the campaign a user with this start payload gets.
+
+        Returns:
+            (step_id, delay) pairs, ordered by delay
+        """
+        version = get_campaign_version()
+        if version != self._version:
+            self._compile(version)
+
+        if start_payload:
+            # Longest matching prefix wins: one dict lookup per prefix length
+            for length in range(min(len(start_payload), self._longest_prefix), 0, -1):
+                steps = self._by_payload.get(start_payload[:length])
+                if steps is not None:
+                    return steps
+        return self._default
+
+    def _compile(self, version: int):
+        by_payload = {}
+        default = []
+        for campaign in get_campaigns(active_only=True):
+            steps = [(step["id"], step["delay"]) for step in campaign["steps"]]
+            if campaign["name"] == DEFAULT_CAMPAIGN:
+                default = steps
+            elif campaign["start_payload"]:
+                by_payload[campaign["start_payload"]] = steps
+
+        self._by_payload = by_payload
+        self._default = default
+        self._longest_prefix = max(map(len, by_payload), default=0)
+        self._version = version
+        print(f"📋 Loaded {len(by_payload)} campaigns (+ default, {len(default)} steps), version {version}")
+
+
+# The process-wide compiled schedule
+schedule = CampaignSchedule()
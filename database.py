@@ -3,28 +3,208 @@ SQLite Database Module for Telegram Bot
 Replaces JSON storage with atomic, concurrent-safe database operations.
 """
 
+import os
 import sqlite3
+from array import array
 import json
+import threading
 import time
-import uuid
 from pathlib import Path
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from contextlib import contextmanager
 
 # Database path
 DB_PATH = Path("storage/bot.db")
 
+# Connection tuning (applied once per connection, not per call)
+STATEMENT_CACHE_SIZE = 256
+
+# Campaign the MSG_*_ID drip schedule belongs to (and users without a
+# matching start payload get)
+DEFAULT_CAMPAIGN = "default"
+
+# meta key bumped by triggers whenever a campaign or step changes
+CAMPAIGNS_VERSION_KEY = "campaigns_version"
+
+# Task statuses that are never sent again (archived after the retention period)
+FINISHED_STATUSES = ("sent", "failed", "cancelled", "expired")
+
+# PRAGMA auto_vacuum value of INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+# One long-lived connection per thread (and per process, see _connect)
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    Open a new connection with WAL mode and tuned pragmas.
+    
+    Writes start with BEGIN IMMEDIATE so concurrent writers (bot.py and
+    worker.py) queue on busy_timeout instead of failing on lock upgrade.
+    DB_BUSY_TIMEOUT_MS / DB_CACHE_SIZE_KB are read here, after load_dotenv.
+    
+    auto_vacuum=INCREMENTAL only takes effect on a database file that has
+    no tables yet, and must come before journal_mode=WAL, which initializes
+    the file; on an existing database it is a no-op (see
+    enable_incremental_vacuum).
+    """
+    busy_timeout_ms = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+    cache_size_kb = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+    
+    conn = sqlite3.connect(
+        str(DB_PATH),
+        timeout=busy_timeout_ms / 1000,
+        isolation_level="IMMEDIATE",
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+    conn.execute(f"PRAGMA cache_size=-{cache_size_kb}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Return this thread's connection, reopening it after a fork."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    
+    conn = _connect()
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
 
 @contextmanager
 def get_db():
-    """Context manager for database connections."""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+    """
+    Context manager for database connections.
+    
+    Yields the calling thread's persistent connection. Any transaction left
+    open by the caller (e.g. after an exception) is rolled back on exit so
+    the connection is clean for the next call.
+    """
+    conn = _get_connection()
     try:
         yield conn
     finally:
-        conn.close()
+        if conn.in_transaction:
+            conn.rollback()
+
+
+def close_db():
+    """Close this thread's persistent connection, if any."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        if _local.pid == os.getpid():
+            conn.close()
+        _local.conn = None
+
+
+def _add_column_if_missing(conn: sqlite3.Connection, table: str, column: str, definition: str):
+    """
+    Add a column to an existing table (schema migration for older databases).
+    
+    Only called inside init_db's BEGIN IMMEDIATE transaction, so the check
+    and the ALTER can not race another process starting at the same time.
+    """
+    columns = [row['name'] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _create_tasks_table(conn: sqlite3.Connection, name: str):
+    """Create the tasks table (or a rebuild of it) under the given name."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            step_id INTEGER NOT NULL REFERENCES campaign_steps(id),
+            send_at INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            retries INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires INTEGER,
+            last_error TEXT
+        )
+    """)
+
+
+def _migrate_task_payloads(conn: sqlite3.Connection):
+    """
+    Rebuild a pre-campaign tasks table (uuid TEXT id, task_type, JSON payload).
+    
+    Every distinct task_type/payload becomes a step of the default campaign
+    and the rows are copied with an integer id and a step_id. Runs inside
+    init_db's BEGIN IMMEDIATE transaction, so only one process ever migrates.
+    """
+    columns = [row['name'] for row in conn.execute("PRAGMA table_info(tasks)")]
+    if "payload" not in columns:
+        return
+    
+    campaign_id = _get_campaign_id(conn, DEFAULT_CAMPAIGN)
+    conn.execute("""
+        CREATE TEMP TABLE step_map (task_type TEXT, payload TEXT, step_id INTEGER)
+    """)
+    
+    for row in conn.execute("SELECT DISTINCT task_type, payload FROM tasks").fetchall():
+        payload = json.loads(row['payload']) if row['payload'] else {}
+        # Delay and freshness are filled in when the schedule is next synced
+        step_id = _get_step_id(conn, campaign_id, {
+            "type": row['task_type'] or "unknown",
+            "source_channel_id": payload.get("source_channel_id") or 0,
+            "message_id": payload.get("message_id") or 0,
+            "check_membership": payload.get("check_membership", False)
+        })
+        conn.execute("INSERT INTO step_map VALUES (?, ?, ?)",
+                     (row['task_type'], row['payload'], step_id))
+    
+    _create_tasks_table(conn, "tasks_new")
+    cursor = conn.execute("""
+        INSERT INTO tasks_new 
+        (chat_id, step_id, send_at, status, retries, lease_owner, lease_expires, last_error)
+        SELECT t.chat_id, m.step_id, t.send_at, t.status, COALESCE(t.retries, 0),
+               t.lease_owner, t.lease_expires, t.last_error
+        FROM tasks AS t 
+        JOIN step_map AS m ON m.task_type IS t.task_type AND m.payload IS t.payload
+        ORDER BY t.send_at, t.rowid
+    """)
+    migrated = cursor.rowcount
+    
+    # Dropping the old table drops its indexes; init_db recreates them
+    conn.execute("DROP TABLE tasks")
+    conn.execute("ALTER TABLE tasks_new RENAME TO tasks")
+    conn.execute("DROP TABLE step_map")
+    print(f"📦 Migrated {migrated} tasks to campaign steps")
+
+
+def _get_campaign_id(conn: sqlite3.Connection, name: str) -> int:
+    """ID of the named campaign, creating it if needed, on an open connection."""
+    conn.execute("INSERT OR IGNORE INTO campaigns (name) VALUES (?)", (name,))
+    return conn.execute("SELECT id FROM campaigns WHERE name = ?", (name,)).fetchone()['id']
+
+
+def _get_step_id(conn: sqlite3.Connection, campaign_id: int, step: Dict[str, Any]) -> int:
+    """ID of the campaign step sending this message, creating it if needed."""
+    key = (campaign_id, step["type"], step["source_channel_id"], step["message_id"],
+           1 if step.get("check_membership") else 0)
+    conn.execute("""
+        INSERT OR IGNORE INTO campaign_steps 
+        (campaign_id, task_type, source_channel_id, message_id, check_membership)
+        VALUES (?, ?, ?, ?, ?)
+    """, key)
+    return conn.execute("""
+        SELECT id FROM campaign_steps 
+        WHERE campaign_id = ? AND task_type = ? AND source_channel_id = ?
+          AND message_id = ? AND check_membership = ?
+    """, key).fetchone()['id']
 
 
 def init_db():
@@ -48,7 +228,21 @@ def init_db():
     
     try:
         with get_db() as conn:
-            # Users table
+            # Space freed by deletes (e.g. archived tasks) is returned with
+            # PRAGMA incremental_vacuum. New databases get it from _connect;
+            # converting an older one rewrites the whole file, so it is left
+            # to a maintenance window instead of running under a live process
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+                print("⚠️ Incremental vacuum is off for this database, freed space is not returned")
+                print("   Run enable_incremental_vacuum.sh during a maintenance window to turn it on")
+            
+            # bot.py and worker.py start together and both get here: schema
+            # and migrations run in one transaction (SQLite DDL is transactional),
+            # so the second process waits and then finds everything in place
+            conn.execute("BEGIN IMMEDIATE")
+            
+            # Users table (reachable/unreachable_*: dead-chat registry; bot_id:
+            # helper bot the user started, NULL = primary bot)
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS users (
                     chat_id INTEGER PRIMARY KEY,
@@ -57,28 +251,203 @@ def init_db():
                     first_name TEXT,
                     last_name TEXT,
                     start_payload TEXT,
-                    timestamp_utc TEXT
+                    timestamp_utc TEXT,
+                    reachable INTEGER NOT NULL DEFAULT 1,
+                    unreachable_reason TEXT,
+                    unreachable_at INTEGER,
+                    bot_id INTEGER
                 )
             """)
             
-            # Tasks table
+            # Drip campaigns and their steps; each message is defined once here
             conn.execute("""
-                CREATE TABLE IF NOT EXISTS tasks (
-                    id TEXT PRIMARY KEY,
-                    chat_id INTEGER,
-                    task_type TEXT,
-                    send_at INTEGER,
-                    status TEXT,
-                    retries INTEGER,
-                    payload TEXT
+                CREATE TABLE IF NOT EXISTS campaigns (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    start_payload TEXT,
+                    active INTEGER NOT NULL DEFAULT 1
                 )
             """)
             
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS campaign_steps (
+                    id INTEGER PRIMARY KEY,
+                    campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+                    task_type TEXT NOT NULL,
+                    delay INTEGER NOT NULL DEFAULT 0,
+                    max_lateness INTEGER,
+                    source_channel_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    check_membership INTEGER NOT NULL DEFAULT 0,
+                    active INTEGER NOT NULL DEFAULT 1,
+                    UNIQUE (campaign_id, task_type, source_channel_id, message_id, check_membership)
+                )
+            """)
+            
+            # Tasks table: one compact row per scheduled message
+            _create_tasks_table(conn, "tasks")
+            
+            # Lease columns for claimed ('in_flight') tasks
+            _add_column_if_missing(conn, "tasks", "lease_owner", "TEXT")
+            _add_column_if_missing(conn, "tasks", "lease_expires", "INTEGER")
+            
+            # Outcome of the last failed send attempt
+            _add_column_if_missing(conn, "tasks", "last_error", "TEXT")
+            
+            # Tasks from before campaign_steps carried a uuid and a JSON payload
+            _migrate_task_payloads(conn)
+            
             conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_tasks_pending 
                 ON tasks(status, send_at)
             """)
             
+            # Dead-chat registry: users who blocked the bot or were deleted
+            _add_column_if_missing(conn, "users", "reachable", "INTEGER NOT NULL DEFAULT 1")
+            _add_column_if_missing(conn, "users", "unreachable_reason", "TEXT")
+            _add_column_if_missing(conn, "users", "unreachable_at", "INTEGER")
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_reachable 
+                ON users(reachable, chat_id)
+            """)
+            
+            # A chat's tasks by status and due time (cancelling a chat's tasks,
+            # expiring superseded ones); replaces idx_tasks_chat(chat_id, status)
+            conn.execute("DROP INDEX IF EXISTS idx_tasks_chat")
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_tasks_chat_due 
+                ON tasks(chat_id, status, send_at)
+            """)
+            
+            # Broadcast jobs, run by the worker and resumable from `cursor`
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    mode TEXT,
+                    from_chat_id INTEGER,
+                    message_id INTEGER,
+                    status TEXT,
+                    cursor INTEGER,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    blocked INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires INTEGER,
+                    created_at INTEGER,
+                    finished_at INTEGER,
+                    concurrency INTEGER,
+                    rate REAL,
+                    segment TEXT,
+                    text TEXT,
+                    entities TEXT
+                )
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status 
+                ON broadcast_jobs(status, id)
+            """)
+            
+            # Concurrency and send rate the adaptive broadcast engine settled on
+            _add_column_if_missing(conn, "broadcast_jobs", "concurrency", "INTEGER")
+            _add_column_if_missing(conn, "broadcast_jobs", "rate", "REAL")
+            
+            # Helper bot the user started (sends must come from it; NULL = primary bot)
+            _add_column_if_missing(conn, "users", "bot_id", "INTEGER")
+            
+            # Audience segment of a broadcast (JSON, NULL = everyone)
+            _add_column_if_missing(conn, "broadcast_jobs", "segment", "TEXT")
+            
+            # Text or caption sent instead of the post's own (its /chat header
+            # removed), with its formatting entities as JSON
+            _add_column_if_missing(conn, "broadcast_jobs", "text", "TEXT")
+            _add_column_if_missing(conn, "broadcast_jobs", "entities", "TEXT")
+            
+            # Segment pages of reachable users by ad campaign payload and signup
+            # time, walked in (key, chat_id) order (see _segment_page); replace
+            # the earlier (key, reachable) indexes, which keyset paging could not use
+            conn.execute("DROP INDEX IF EXISTS idx_users_payload")
+            conn.execute("DROP INDEX IF EXISTS idx_users_signup")
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_payload_chat 
+                ON users(reachable, start_payload, chat_id)
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_signup_chat 
+                ON users(reachable, timestamp_utc, chat_id)
+            """)
+            
+            # Live worker processes and when they were last seen; every bot's
+            # send budget is split between them (see register_worker)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS workers (
+                    id TEXT PRIMARY KEY,
+                    seen_at INTEGER NOT NULL
+                )
+            """)
+            
+            # Small key/value store for process state (e.g. the results feed position)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            
+            # Parsed /results position updates, keyed by channel message ID
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS result_updates (
+                    message_id INTEGER PRIMARY KEY,
+                    text TEXT NOT NULL
+                )
+            """)
+            
+            # Campaigns chosen by deep-link payload prefix (see campaigns.py);
+            # retired steps stay for the tasks that still reference them
+            _add_column_if_missing(conn, "campaigns", "start_payload", "TEXT")
+            _add_column_if_missing(conn, "campaigns", "active", "INTEGER NOT NULL DEFAULT 1")
+            _add_column_if_missing(conn, "campaign_steps", "active", "INTEGER NOT NULL DEFAULT 1")
+            
+            conn.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_campaigns_payload 
+                ON campaigns(start_payload) WHERE active = 1
+            """)
+            
+            # Any campaign change bumps a version, so processes reload their
+            # compiled schedule only when it actually changed
+            for table in ("campaigns", "campaign_steps"):
+                for event in ("INSERT", "UPDATE", "DELETE"):
+                    conn.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version 
+                        AFTER {event} ON {table}
+                        BEGIN
+                            INSERT OR REPLACE INTO meta (key, value) VALUES (
+                                '{CAMPAIGNS_VERSION_KEY}',
+                                COALESCE((SELECT value FROM meta WHERE key = '{CAMPAIGNS_VERSION_KEY}'), 0) + 1
+                            );
+                        END
+                    """)
+            
+            # Finished tasks moved out of `tasks` by archive_finished_tasks,
+            # kept as counts per UTC day of send_at, step and status
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS task_archive (
+                    day INTEGER NOT NULL,
+                    step_id INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (day, step_id, status)
+                ) WITHOUT ROWID
+            """)
+            
+            # Refresh planner statistics (sampled, so cheap on large tables);
+            # they let segment counts pick the segment indexes over idx_users_reachable
+            conn.execute("PRAGMA analysis_limit=1000")
+            conn.execute("ANALYZE users")
+            
             conn.commit()
             print("✅ Database initialized successfully")
             
@@ -106,8 +475,8 @@ def add_user(user_data: Dict[str, Any]) -> bool:
         with get_db() as conn:
             conn.execute("""
                 INSERT OR REPLACE INTO users 
-                (chat_id, user_id, username, first_name, last_name, start_payload, timestamp_utc)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                (chat_id, user_id, username, first_name, last_name, start_payload, timestamp_utc, bot_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 user_data.get('chat_id'),
                 user_data.get('user_id'),
@@ -115,7 +484,8 @@ def add_user(user_data: Dict[str, Any]) -> bool:
                 user_data.get('first_name'),
                 user_data.get('last_name'),
                 user_data.get('start_payload'),
-                user_data.get('timestamp_utc')
+                user_data.get('timestamp_utc'),
+                user_data.get('bot_id')
             ))
             conn.commit()
         return True
@@ -124,183 +494,1286 @@ def add_user(user_data: Dict[str, Any]) -> bool:
         return False
 
 
-def get_all_users() -> List[Dict[str, Any]]:
+def add_user_if_new(user_data: Dict[str, Any]) -> bool:
+    """
+    Insert user only if their chat_id is not stored yet.
+    
+    Atomic on the users primary key, so two concurrent /start updates for
+    the same chat cannot both be treated as new. /start uses register_user,
+    which also schedules the campaign; this is kept as API surface for
+    callers that only need the user stored.
+    
+    Args:
+        user_data: Dictionary with user information
+        
+    Returns:
+        True if the user was inserted, False if they already existed
+        
+    Raises:
+        sqlite3.Error: The database could not be read or written, so it is
+        unknown whether the user existed
+    """
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO users 
+                (chat_id, user_id, username, first_name, last_name, start_payload, timestamp_utc, bot_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                user_data.get('chat_id'),
+                user_data.get('user_id'),
+                user_data.get('username'),
+                user_data.get('first_name'),
+                user_data.get('last_name'),
+                user_data.get('start_payload'),
+                user_data.get('timestamp_utc'),
+                user_data.get('bot_id')
+            ))
+            conn.commit()
+            return cursor.rowcount == 1
+    except Exception as e:
+        print(f"❌ Error adding user: {e}")
+        raise
+
+
+def user_exists(chat_id: int) -> bool:
+    """
+    Check whether a user is stored (primary key lookup).
+    
+    Not used by the bot since /start went through register_user; kept as
+    API surface.
+    
+    Args:
+        chat_id: Telegram chat ID
+        
+    Returns:
+        True if the user is stored
+        
+    Raises:
+        sqlite3.Error: The database could not be read, so it is unknown
+        whether the user exists
+    """
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("SELECT 1 FROM users WHERE chat_id = ?", (chat_id,))
+            return cursor.fetchone() is not None
+    except Exception as e:
+        print(f"❌ Error checking user: {e}")
+        raise
+
+
+def get_all_users(reachable_only: bool = False) -> List[Dict[str, Any]]:
     """
     Get all users from database.
     
+    Args:
+        reachable_only: Skip users who blocked the bot or were deleted
+    
     Returns:
     List of user dictionaries
     """
     try:
         with get_db() as conn:
-            cursor = conn.execute("SELECT * FROM users")
+            if reachable_only:
+                cursor = conn.execute("SELECT * FROM users WHERE reachable = 1")
+            else:
+                cursor = conn.execute("SELECT * FROM users")
             return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
         print(f"❌ Error fetching users: {e}")
         return []
 
 
-def create_task(chat_id: int, task_type: str, send_at: int, payload: Dict[str, Any]) -> str:
+def _segment_conditions(reachable_only: bool, segment: Optional[Dict[str, Any]]):
     """
-    Create a new scheduled task.
+    Build WHERE conditions selecting an audience segment of users.
+    
+    Payload and date filters are ranges on indexed columns: a payload
+    prefix becomes start_payload >= prefix AND < prefix-with-last-character-
+    incremented, and dates compare against the ISO timestamp_utc strings.
     
     Args:
-        chat_id: Telegram chat ID
-        task_type: Type of task
-        send_at: Unix timestamp when to send
-        payload: Message content and metadata
+        reachable_only: Skip users who blocked the bot or were deleted
+        segment: Optional filters: 'payload' (prefix of start_payload),
+            'since' / 'until' (inclusive YYYY-MM-DD signup dates, UTC),
+            'bot_id' (users of one helper bot, 0 = primary bot)
+        
+    Returns:
+        (list of SQL conditions, list of parameters)
+    """
+    conditions, params = [], []
+    
+    if reachable_only:
+        conditions.append("reachable = 1")
+    
+    segment = segment or {}
+    
+    prefix = segment.get("payload")
+    if prefix:
+        conditions.append("start_payload >= ? AND start_payload < ?")
+        params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+    
+    if segment.get("since"):
+        conditions.append("timestamp_utc >= ?")
+        params.append(segment["since"])
+    
+    if "bot_id" in segment:
+        conditions.append("IFNULL(bot_id, 0) = ?")
+        params.append(segment["bot_id"])
+    
+    if segment.get("until"):
+        day_after = datetime.strptime(segment["until"], "%Y-%m-%d") + timedelta(days=1)
+        conditions.append("timestamp_utc < ?")
+        params.append(day_after.strftime("%Y-%m-%d"))
+    
+    return conditions, params
+
+
+def _segment_page(after: Optional[int], reachable_only: bool, segment: Optional[Dict[str, Any]]):
+    """
+    Build the WHERE and ORDER BY of a keyset page of a segment.
+    
+    Reachable users of a payload or date segment are walked in
+    (start_payload, chat_id) or (timestamp_utc, chat_id) order, so the page
+    is a range scan of idx_users_payload_chat or idx_users_signup_chat that
+    stops after LIMIT rows; the cursor stays a chat ID and its key is read
+    back from users (neither column changes after signup). Everything else
+    pages by chat_id.
+    
+    Args:
+        after: Last chat ID of the previous page, or None for the first page
+        reachable_only: Skip users who blocked the bot or were deleted
+        segment: Optional audience filters (see _segment_conditions)
         
     Returns:
-        Task ID (UUID)
+        (WHERE clause, ORDER BY clause, list of parameters)
     """
-    task_id = uuid.uuid4().hex
+    conditions, params = _segment_conditions(reachable_only, segment)
+    segment = segment or {}
     
+    if reachable_only and segment.get("payload"):
+        key = "start_payload"
+    elif reachable_only and (segment.get("since") or segment.get("until")):
+        key = "timestamp_utc"
+    else:
+        conditions.append("chat_id > ?")
+        params.append(-2 ** 63 if after is None else after)  # Smallest SQLite integer
+        return " AND ".join(conditions), "chat_id", params
+    
+    if after is not None:
+        conditions.append(f"({key}, chat_id) > ((SELECT {key} FROM users WHERE chat_id = ?), ?)")
+        params += [after, after]
+    return " AND ".join(conditions), f"{key}, chat_id", params
+
+
+def get_user_chat_id_page(after: Optional[int], limit: int, reachable_only: bool = True,
+                          segment: Optional[Dict[str, Any]] = None) -> array:
+    """
+    Get one page of user chat IDs in keyset order (see _segment_page).
+    
+    Args:
+        after: Last chat ID of the previous page, or None for the first page
+        limit: Page size
+        reachable_only: Skip users who blocked the bot or were deleted
+        segment: Optional audience filters (see _segment_conditions)
+        
+    Returns:
+        Compact array('q') of chat IDs (empty when there are no more users)
+    """
     try:
+        where, order, params = _segment_page(after, reachable_only, segment)
+        
         with get_db() as conn:
-            conn.execute("""
-                INSERT INTO tasks 
-                (id, chat_id, task_type, send_at, status, retries, payload)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                task_id,
-                chat_id,
-                task_type,
-                send_at,
-                "pending",
-                0,
-                json.dumps(payload)
-            ))
-            conn.commit()
-        return task_id
+            cursor = conn.execute(f"""
+                SELECT chat_id FROM users 
+                WHERE {where}
+                ORDER BY {order}
+                LIMIT ?
+            """, params + [limit])
+            return array('q', (row[0] for row in cursor))
     except Exception as e:
-        print(f"❌ Error creating task: {e}")
-        return ""
+        print(f"❌ Error fetching user page: {e}")
+        return array('q')
 
 
-def get_pending_tasks() -> List[Dict[str, Any]]:
+def get_broadcast_recipients(after: Optional[int], limit: int, reachable_only: bool = True,
+                             segment: Optional[Dict[str, Any]] = None) -> Tuple[array, array]:
     """
-    Get all pending tasks that are ready to be sent.
+    Get one keyset page of recipients with the bot each must be sent from.
     
+    Args:
+        after: Last chat ID of the previous page, or None for the first page
+        limit: Page size
+        reachable_only: Skip users who blocked the bot or were deleted
+        segment: Optional audience filters (see _segment_conditions)
+        
     Returns:
-        List of pending task dictionaries
+        (array('q') of chat IDs, parallel array('q') of bot IDs, 0 = primary bot)
     """
-    now = int(time.time())
-    
+    chat_ids, bot_ids = array('q'), array('q')
     try:
+        where, order, params = _segment_page(after, reachable_only, segment)
+        
         with get_db() as conn:
-            cursor = conn.execute("""
-                SELECT * FROM tasks 
-                WHERE status = 'pending' AND send_at <= ?
-                ORDER BY send_at ASC
-            """, (now,))
-            
-            tasks = []
-            for row in cursor.fetchall():
-                task = dict(row)
-                task['payload'] = json.loads(task['payload'])
-                tasks.append(task)
-            return tasks
+            cursor = conn.execute(f"""
+                SELECT chat_id, bot_id FROM users 
+                WHERE {where}
+                ORDER BY {order}
+                LIMIT ?
+            """, params + [limit])
+            for chat_id, bot_id in cursor:
+                chat_ids.append(chat_id)
+                bot_ids.append(bot_id or 0)
     except Exception as e:
-        print(f"❌ Error fetching pending tasks: {e}")
-        return []
+        print(f"❌ Error fetching broadcast recipients: {e}")
+        return array('q'), array('q')
+    return chat_ids, bot_ids
 
 
-def update_task_status(task_id: str, status: str, increment_retry: bool = False) -> bool:
+def iter_user_chat_ids(chunk_size: int = 1000, reachable_only: bool = True) -> Iterator[array]:
     """
-    Update task status and optionally increment retry counter.
+    Stream all user chat IDs in chunks without loading the users table.
     
     Args:
-        task_id: Task ID to update
-        status: New status
-        increment_retry: Whether to increment retry counter
+        chunk_size: Chat IDs per chunk
+        reachable_only: Skip users who blocked the bot or were deleted
+        
+    Yields:
+        array('q') chunks of chat IDs
+    """
+    after = None
+    while True:
+        chunk = get_user_chat_id_page(after, chunk_size, reachable_only)
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]
+
+
+def save_campaign(name: str, start_payload: Optional[str], steps: List[Dict[str, Any]]) -> Optional[int]:
+    """
+    Create or replace a campaign and its steps, and activate it.
+    
+    A step is identified by the message it sends, so tasks already queued
+    keep their message when a campaign is edited: listed steps are reused
+    (with delay and max_lateness updated in place) or created, and steps
+    no longer listed are deactivated. Rows are only written when something
+    changed, so saving an unchanged campaign does not bump its version.
+    
+    Args:
+        name: Campaign name
+        start_payload: Deep-link payload prefix that selects the campaign
+                       (None for the default campaign)
+        steps: Schedule items with type, delay, max_lateness, source_channel_id,
+               message_id and check_membership
         
     Returns:
-        True if successful
+        Campaign ID, or None on error (e.g. another active campaign already
+        uses this start payload)
     """
     try:
         with get_db() as conn:
-            if increment_retry:
-                conn.execute("""
-                    UPDATE tasks 
-                    SET status = ?, retries = retries + 1
-                    WHERE id = ?
-                """, (status, task_id))
-            else:
+            campaign_id = _get_campaign_id(conn, name)
+            conn.execute("""
+                UPDATE campaigns SET start_payload = ?, active = 1 
+                WHERE id = ? AND (start_payload IS NOT ? OR active = 0)
+            """, (start_payload, campaign_id, start_payload))
+            
+            step_ids = []
+            for step in steps:
+                step_id = _get_step_id(conn, campaign_id, step)
                 conn.execute("""
-                    UPDATE tasks 
-                    SET status = ?
-                    WHERE id = ?
-                """, (status, task_id))
+                    UPDATE campaign_steps SET delay = ?, max_lateness = ?, active = 1 
+                    WHERE id = ? AND (delay IS NOT ? OR max_lateness IS NOT ? OR active = 0)
+                """, (step["delay"], step.get("max_lateness"), step_id,
+                      step["delay"], step.get("max_lateness")))
+                step_ids.append(step_id)
+            
+            placeholders = ",".join("?" * len(step_ids))
+            conn.execute(f"""
+                UPDATE campaign_steps SET active = 0 
+                WHERE campaign_id = ? AND active = 1 AND id NOT IN ({placeholders})
+            """, [campaign_id] + step_ids)
             conn.commit()
-        return True
+            return campaign_id
     except Exception as e:
-        print(f"❌ Error updating task: {e}")
-        return False
+        print(f"❌ Error saving campaign {name}: {e}")
+        return None
 
 
-def cancel_user_tasks(chat_id: int) -> int:
+def set_campaign_active(name: str, active: bool) -> bool:
     """
-    Cancel all pending tasks for a user.
+    Switch a campaign on or off; new users of an inactive campaign's payload
+    get the default campaign. Already queued tasks are not affected.
     
-    Args:
-        chat_id: Telegram chat ID
-        
     Returns:
-        Number of tasks cancelled
+        True if the campaign exists
     """
     try:
         with get_db() as conn:
             cursor = conn.execute("""
-                UPDATE tasks 
-                SET status = 'cancelled'
-                WHERE chat_id = ? AND status = 'pending'
-            """, (chat_id,))
+                UPDATE campaigns SET active = ? WHERE name = ?
+            """, (1 if active else 0, name))
             conn.commit()
-            return cursor.rowcount
+            return cursor.rowcount == 1
     except Exception as e:
-        print(f"❌ Error cancelling tasks: {e}")
-        return 0
+        print(f"❌ Error updating campaign {name}: {e}")
+        return False
 
 
-def get_user_count() -> int:
-    """Get total number of users."""
+def get_campaign_version() -> int:
+    """Version counter bumped on every campaign or step change (0 if never changed)."""
     try:
         with get_db() as conn:
-            cursor = conn.execute("SELECT COUNT(*) as count FROM users")
-            return cursor.fetchone()['count']
+            return int(_get_meta(conn, CAMPAIGNS_VERSION_KEY) or 0)
     except Exception as e:
-        print(f"❌ Error getting user count: {e}")
+        print(f"❌ Error fetching campaign version: {e}")
         return 0
 
 
-def get_task_stats() -> Dict[str, int]:
+def get_campaigns(active_only: bool = False) -> List[Dict[str, Any]]:
     """
-    Get statistics about tasks.
+    Get campaigns with their active steps.
     
+    Args:
+        active_only: Skip campaigns that are switched off
+        
     Returns:
-        Dictionary with task counts by status
+        List of campaign dictionaries (id, name, start_payload, active) with
+        a 'steps' list ordered by delay
     """
     try:
         with get_db() as conn:
-            cursor = conn.execute("""
-                SELECT status, COUNT(*) as count 
-                FROM tasks 
-                GROUP BY status
-            """)
+            campaigns = [dict(row) for row in conn.execute(f"""
+                SELECT id, name, start_payload, active FROM campaigns 
+                {"WHERE active = 1" if active_only else ""}
+                ORDER BY id
+            """)]
             
-            stats = {
-                "pending": 0,
-                "sent": 0,
-                "failed": 0,
-                "cancelled": 0,
-                "total": 0
-            }
+            steps: Dict[int, List[Dict[str, Any]]] = {}
+            for row in conn.execute("""
+                SELECT id, campaign_id, task_type, delay, max_lateness,
+                       source_channel_id, message_id, check_membership
+                FROM campaign_steps 
+                WHERE active = 1
+                ORDER BY delay, id
+            """):
+                steps.setdefault(row['campaign_id'], []).append(dict(row))
             
-            for row in cursor.fetchall():
-                stats[row['status']] = row['count']
+            for campaign in campaigns:
+                campaign['steps'] = steps.get(campaign['id'], [])
+            return campaigns
+    except Exception as e:
+        print(f"❌ Error fetching campaigns: {e}")
+        return []
+
+
+def create_task(chat_id: int, step_id: int, send_at: int) -> Optional[int]:
+    """
+    Create a new scheduled task.
+    
+    Args:
+        chat_id: Telegram chat ID
+        step_id: Campaign step to send
+        send_at: Unix timestamp when to send
+        
+    Returns:
+        Task ID, or None on error
+    """
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                INSERT INTO tasks (chat_id, step_id, send_at, status)
+                VALUES (?, ?, ?, 'pending')
+            """, (chat_id, step_id, send_at))
+            conn.commit()
+        return cursor.lastrowid
+    except Exception as e:
+        print(f"❌ Error creating task: {e}")
+        return None
+
+
+def _insert_tasks(conn: sqlite3.Connection, rows: List[Dict[str, Any]]) -> List[int]:
+    """Insert task rows on an open connection and return their IDs."""
+    task_ids = []
+    for row in rows:
+        cursor = conn.execute("""
+            INSERT INTO tasks (chat_id, step_id, send_at, status)
+            VALUES (?, ?, ?, 'pending')
+        """, (row['chat_id'], row['step_id'], row['send_at']))
+        task_ids.append(cursor.lastrowid)
+    return task_ids
+
+
+def create_tasks(rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Create several scheduled tasks in a single transaction.
+    
+    Args:
+        rows: Task dictionaries with chat_id, step_id and send_at
+        
+    Returns:
+        List of task IDs (empty on error)
+    """
+    if not rows:
+        return []
+    
+    try:
+        with get_db() as conn:
+            task_ids = _insert_tasks(conn, rows)
+            conn.commit()
+        return task_ids
+    except Exception as e:
+        print(f"❌ Error creating tasks: {e}")
+        return []
+
+
+def register_user(user_data: Dict[str, Any], rows: List[Dict[str, Any]]) -> Optional[List[int]]:
+    """
+    Insert a new user and their scheduled tasks in one transaction.
+    
+    Args:
+        user_data: Dictionary with user information
+        rows: Task dictionaries with chat_id, step_id and send_at
+        
+    Returns:
+        List of created task IDs, or None if the user already existed
+        
+    Raises:
+        sqlite3.Error: Nothing was saved (the transaction was rolled back)
+    """
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO users 
+                (chat_id, user_id, username, first_name, last_name, start_payload, timestamp_utc, bot_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                user_data.get('chat_id'),
+                user_data.get('user_id'),
+                user_data.get('username'),
+                user_data.get('first_name'),
+                user_data.get('last_name'),
+                user_data.get('start_payload'),
+                user_data.get('timestamp_utc'),
+                user_data.get('bot_id')
+            ))
+            if cursor.rowcount != 1:
+                # Returning user: a /start proves they can receive messages again,
+                # from the bot they just started (otherwise they keep their bot)
+                conn.execute("""
+                    UPDATE users 
+                    SET reachable = 1, unreachable_reason = NULL, unreachable_at = NULL, bot_id = ?
+                    WHERE chat_id = ? AND reachable = 0
+                """, (user_data.get('bot_id'), user_data.get('chat_id')))
+                conn.commit()
+                return None
+            
+            task_ids = _insert_tasks(conn, rows) if rows else []
+            conn.commit()
+            return task_ids
+    except Exception as e:
+        print(f"❌ Error registering user: {e}")
+        raise
+
+
+# A task row plus the message its campaign step sends
+TASK_COLUMNS = """
+    tasks.*, step.task_type, step.source_channel_id, step.message_id, step.check_membership
+"""
+
+
+def get_pending_tasks(limit: int = 1000) -> List[Dict[str, Any]]:
+    """
+    Get the oldest pending tasks that are ready to be sent.
+    
+    Args:
+        limit: Maximum number of tasks to return (the backlog can be huge)
+        
+    Returns:
+        List of pending task dictionaries
+    """
+    now = int(time.time())
+    
+    try:
+        with get_db() as conn:
+            cursor = conn.execute(f"""
+                SELECT {TASK_COLUMNS} FROM tasks 
+                JOIN campaign_steps AS step ON step.id = tasks.step_id
+                WHERE tasks.status = 'pending' AND tasks.send_at <= ?
+                ORDER BY tasks.send_at ASC
+                LIMIT ?
+            """, (now, limit))
+            return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"❌ Error fetching pending tasks: {e}")
+        return []
+
+
+def claim_due_tasks(owner: str, limit: int, lease_seconds: int) -> List[Dict[str, Any]]:
+    """
+    Atomically claim due tasks for one worker.
+    
+    Due pending tasks (and in-flight tasks whose lease expired, e.g. after a
+    worker crash) are flipped to 'in_flight' under a lease owned by `owner`.
+    The select and update run inside one BEGIN IMMEDIATE transaction, so
+    workers sharing the database never claim the same task twice.
+    
+    Args:
+        owner: Unique worker identifier
+        limit: Maximum number of tasks to claim
+        lease_seconds: How long the claim is valid before it can be reclaimed
+        
+    Returns:
+        List of claimed task dictionaries with their step's message and
+        the user's bot_id (None = primary bot)
+    """
+    now = int(time.time())
+    
+    try:
+        with get_db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            
+            # Two queries that each walk idx_tasks_pending in order and stop at
+            # `limit`; a single OR query would sort the whole backlog every page
+            rows = conn.execute(f"""
+                SELECT {TASK_COLUMNS}, users.bot_id FROM tasks 
+                JOIN campaign_steps AS step ON step.id = tasks.step_id
+                LEFT JOIN users ON users.chat_id = tasks.chat_id
+                WHERE tasks.status = 'pending' AND tasks.send_at <= ?
+                ORDER BY tasks.send_at ASC, tasks.id ASC
+                LIMIT ?
+            """, (now, limit)).fetchall()
+            
+            rows += conn.execute(f"""
+                SELECT {TASK_COLUMNS}, users.bot_id FROM tasks 
+                JOIN campaign_steps AS step ON step.id = tasks.step_id
+                LEFT JOIN users ON users.chat_id = tasks.chat_id
+                WHERE tasks.status = 'in_flight' AND tasks.lease_expires <= ?
+                ORDER BY tasks.send_at ASC, tasks.id ASC
+                LIMIT ?
+            """, (now, limit)).fetchall()
+            
+            rows = sorted(rows, key=lambda row: (row['send_at'], row['id']))[:limit]
+            
+            if not rows:
+                conn.rollback()
+                return []
+            
+            lease_expires = now + lease_seconds
+            conn.executemany("""
+                UPDATE tasks 
+                SET status = 'in_flight', lease_owner = ?, lease_expires = ?
+                WHERE id = ?
+            """, [(owner, lease_expires, row['id']) for row in rows])
+            conn.commit()
+            
+            tasks = []
+            for row in rows:
+                task = dict(row)
+                task['status'] = 'in_flight'
+                task['lease_owner'] = owner
+                task['lease_expires'] = lease_expires
+                tasks.append(task)
+            return tasks
+    except Exception as e:
+        print(f"❌ Error claiming tasks: {e}")
+        return []
+
+
+def get_next_due_time() -> Optional[int]:
+    """
+    Get the earliest time at which a worker will have something to claim.
+    
+    Uses idx_tasks_pending for the next pending send_at and also considers
+    in-flight leases that will expire and become reclaimable.
+    
+    Returns:
+        Unix timestamp, or None if there is nothing scheduled
+    """
+    try:
+        with get_db() as conn:
+            next_send = conn.execute("""
+                SELECT MIN(send_at) FROM tasks WHERE status = 'pending'
+            """).fetchone()[0]
+            next_lease = conn.execute("""
+                SELECT MIN(lease_expires) FROM tasks WHERE status = 'in_flight'
+            """).fetchone()[0]
+            candidates = [t for t in (next_send, next_lease) if t is not None]
+            return min(candidates) if candidates else None
+    except Exception as e:
+        print(f"❌ Error fetching next due time: {e}")
+        return None
+
+
+def update_task_status(task_id: int, status: str, increment_retry: bool = False,
+                       send_at: Optional[int] = None, last_error: Optional[str] = None,
+                       owner: Optional[str] = None) -> bool:
+    """
+    Update task status and optionally increment retry counter.
+    
+    Args:
+        task_id: Task ID to update
+        status: New status
+        increment_retry: Whether to increment retry counter
+        send_at: New send time (reschedules the task), or None to keep it
+        last_error: Classified error of the failed attempt, or None to keep it
+        owner: Worker that leased the task; if set, the row is only updated
+               while that worker still holds the lease
+        
+    Returns:
+        True if the task was updated
+    """
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                UPDATE tasks 
+                SET status = ?, retries = retries + ?, send_at = COALESCE(?, send_at),
+                    last_error = COALESCE(?, last_error),
+                    lease_owner = NULL, lease_expires = NULL
+                WHERE id = ? AND (? IS NULL OR lease_owner = ?)
+            """, (status, 1 if increment_retry else 0, send_at, last_error, task_id, owner, owner))
+            conn.commit()
+            return cursor.rowcount == 1
+    except Exception as e:
+        print(f"❌ Error updating task: {e}")
+        return False
+
+
+def defer_tasks(task_ids: List[int], not_before: int, owner: Optional[str] = None) -> int:
+    """
+    Return claimed tasks to the queue, not to be sent before `not_before`.
+    
+    Used after a FloodWait: the retry counter is untouched and each task's
+    send_at only ever moves forward.
+    
+    Args:
+        task_ids: Task IDs to defer
+        not_before: Unix timestamp before which the tasks must not be sent
+        owner: Worker that leased the tasks; if set, tasks leased by another
+               worker are left alone
+        
+    Returns:
+        Number of tasks deferred
+    """
+    if not task_ids:
+        return 0
+    
+    try:
+        with get_db() as conn:
+            cursor = conn.executemany("""
+                UPDATE tasks 
+                SET status = 'pending', send_at = MAX(send_at, ?),
+                    lease_owner = NULL, lease_expires = NULL
+                WHERE id = ? AND (? IS NULL OR lease_owner = ?)
+            """, [(not_before, task_id, owner, owner) for task_id in task_ids])
+            conn.commit()
+            return cursor.rowcount
+    except Exception as e:
+        print(f"❌ Error deferring tasks: {e}")
+        return 0
+
+
+def expire_stale_tasks(supersede_after: int = 600, batch_size: int = 1000) -> int:
+    """
+    Retire due tasks that are no longer worth sending (e.g. after an outage).
+    
+    1. Pending tasks more than their campaign step's max_lateness past
+       send_at are marked 'expired'.
+    2. Of a chat's remaining due tasks only the latest is kept; earlier ones
+       more than `supersede_after` past send_at are superseded by it and
+       marked 'expired' too, so a user gets one catch-up message instead of
+       the whole drip sequence at once. Tasks that are only a little late
+       (a /start burst, a short restart) are still sent in order.
+    
+    Each pass finds its work with one read of the due backlog (no write
+    lock), then updates it `batch_size` tasks or chats per transaction, each
+    an indexed lookup, so the write lock is held for a bounded amount of
+    work however large the backlog is. Updates only touch tasks that are
+    still pending, in case a worker claimed them in between.
+    
+    Args:
+        supersede_after: Seconds past send_at before a task can be superseded
+        batch_size: Tasks (pass 1) or chats (pass 2) updated per transaction
+        
+    Returns:
+        Number of tasks expired
+    """
+    now = int(time.time())
+    expired = 0
+    
+    def run_batches(sql: str, rows: List[tuple]) -> int:
+        count = 0
+        for i in range(0, len(rows), batch_size):
+            cursor = conn.executemany(sql, rows[i:i + batch_size])
+            conn.commit()
+            count += cursor.rowcount
+        return count
+    
+    try:
+        with get_db() as conn:
+            stale = conn.execute("""
+                SELECT tasks.id FROM tasks 
+                JOIN campaign_steps AS step ON step.id = tasks.step_id
+                WHERE tasks.status = 'pending' AND tasks.send_at <= ?
+                  AND tasks.send_at < ? - step.max_lateness
+            """, (now, now)).fetchall()
+            
+            expired += run_batches("""
+                UPDATE tasks 
+                SET status = 'expired', last_error = 'expired: too late to send'
+                WHERE id = ? AND status = 'pending'
+            """, [(row['id'],) for row in stale])
+            
+            # Latest due send_at of every chat with more than one due task,
+            # one of them past the grace period, in one pass over idx_tasks_pending
+            overdue = now - supersede_after
+            latest = conn.execute("""
+                SELECT chat_id, MAX(send_at) AS send_at FROM tasks 
+                WHERE status = 'pending' AND send_at <= ?
+                GROUP BY chat_id
+                HAVING COUNT(*) > 1 AND MIN(send_at) < ?
+            """, (now, overdue)).fetchall()
+            
+            # Each chat's earlier overdue tasks via idx_tasks_chat_due (ties
+            # with the latest are kept)
+            expired += run_batches("""
+                UPDATE tasks 
+                SET status = 'expired', last_error = 'expired: superseded by a later message'
+                WHERE chat_id = ? AND status = 'pending' AND send_at < ? AND send_at < ?
+            """, [(row['chat_id'], row['send_at'], overdue) for row in latest])
+    except Exception as e:
+        print(f"❌ Error expiring stale tasks: {e}")
+    
+    return expired
+
+
+def archive_finished_tasks(before: int, batch_size: int = 1000) -> int:
+    """
+    Move one batch of finished tasks out of the tasks table.
+    
+    Sent, failed, cancelled and expired tasks due before `before` are
+    added to the per-day counts in task_archive and deleted, in one short
+    transaction; call again until it returns less than `batch_size`. Keeps
+    `tasks` (and idx_tasks_pending) sized to the live queue.
+    
+    Args:
+        before: Unix timestamp; only tasks with an earlier send_at are archived
+        batch_size: Most tasks moved per call
+        
+    Returns:
+        Number of tasks archived
+    """
+    placeholders = ",".join("?" * len(FINISHED_STATUSES))
+    
+    try:
+        with get_db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            
+            task_ids = [row['id'] for row in conn.execute(f"""
+                SELECT id FROM tasks 
+                WHERE status IN ({placeholders}) AND send_at < ?
+                LIMIT ?
+            """, FINISHED_STATUSES + (before, batch_size))]
+            
+            if not task_ids:
+                conn.rollback()
+                return 0
+            
+            id_placeholders = ",".join("?" * len(task_ids))
+            conn.execute(f"""
+                INSERT INTO task_archive (day, step_id, status, count)
+                SELECT send_at / 86400, step_id, status, COUNT(*) FROM tasks 
+                WHERE id IN ({id_placeholders})
+                GROUP BY 1, 2, 3
+                ON CONFLICT (day, step_id, status) DO UPDATE SET count = count + excluded.count
+            """, task_ids)
+            conn.execute(f"DELETE FROM tasks WHERE id IN ({id_placeholders})", task_ids)
+            conn.commit()
+            return len(task_ids)
+    except Exception as e:
+        print(f"❌ Error archiving tasks: {e}")
+        return 0
+
+
+def enable_incremental_vacuum() -> bool:
+    """
+    Switch an existing database to auto_vacuum=INCREMENTAL.
+    
+    A maintenance step, run by enable_incremental_vacuum.sh with the bot and
+    worker stopped: the VACUUM it needs rewrites the whole file under an
+    exclusive lock. Databases created since _connect set the pragma already
+    have it.
+    
+    Returns:
+        True if incremental vacuum is on afterwards
+    """
+    try:
+        with get_db() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+                print("🧹 Enabling incremental vacuum (VACUUM)...")
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+            return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+    except Exception as e:
+        print(f"❌ Error enabling incremental vacuum: {e}")
+        return False
+
+
+def vacuum_free_pages(max_pages: int) -> int:
+    """
+    Return up to `max_pages` free database pages to the file system.
+    
+    Needs auto_vacuum=INCREMENTAL (see enable_incremental_vacuum); a no-op
+    otherwise.
+    
+    Returns:
+        Number of pages freed
+    """
+    try:
+        with get_db() as conn:
+            free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free_before:
+                return 0
+            
+            # Frees one page per step; execute() would only step it once
+            conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)})")
+            return free_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    except Exception as e:
+        print(f"❌ Error running incremental vacuum: {e}")
+        return 0
+
+
+def cancel_user_tasks(chat_id: int) -> int:
+    """
+    Cancel all pending tasks for a user.
+    
+    Args:
+        chat_id: Telegram chat ID
+        
+    Returns:
+        Number of tasks cancelled
+    """
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                UPDATE tasks 
+                SET status = 'cancelled'
+                WHERE chat_id = ? AND status = 'pending'
+            """, (chat_id,))
+            conn.commit()
+            return cursor.rowcount
+    except Exception as e:
+        print(f"❌ Error cancelling tasks: {e}")
+        return 0
+
+
+def mark_chats_unreachable(chat_ids: List[int], reason: str) -> int:
+    """
+    Record that chats blocked the bot or no longer exist.
+    
+    Flags the users as unreachable and cancels their queued tasks in the
+    same transaction, so no further API calls are spent on them.
+    
+    Args:
+        chat_ids: Telegram chat IDs
+        reason: Error that reported the chat as unreachable
+        
+    Returns:
+        Number of tasks cancelled
+    """
+    if not chat_ids:
+        return 0
+    
+    try:
+        with get_db() as conn:
+            cancelled = _mark_chats_unreachable(conn, chat_ids, reason)
+            conn.commit()
+            return cancelled
+    except Exception as e:
+        print(f"❌ Error marking chats unreachable: {e}")
+        return 0
+
+
+def _mark_chats_unreachable(conn: sqlite3.Connection, chat_ids: List[int], reason: str) -> int:
+    """Flag chats unreachable and cancel their tasks on an open connection."""
+    now = int(time.time())
+    
+    conn.executemany("""
+        UPDATE users 
+        SET reachable = 0, unreachable_reason = ?, unreachable_at = ?
+        WHERE chat_id = ?
+    """, [(reason, now, chat_id) for chat_id in chat_ids])
+    
+    cursor = conn.executemany("""
+        UPDATE tasks 
+        SET status = 'cancelled', last_error = ?,
+            lease_owner = NULL, lease_expires = NULL
+        WHERE chat_id = ? AND status IN ('pending', 'in_flight')
+    """, [(reason, chat_id) for chat_id in chat_ids])
+    return cursor.rowcount
+
+
+def create_broadcast_job(mode: str, from_chat_id: int, message_id: int,
+                         segment: Optional[Dict[str, Any]] = None, text: Optional[str] = None,
+                         entities: Optional[List[Dict[str, Any]]] = None) -> int:
+    """
+    Queue a broadcast for the worker.
+    
+    Args:
+        mode: 'copy' (no "Forwarded from" tag, with Join button; `text`
+            replaces the caption), 'text' (sends `text` with Join button)
+            or 'forward'
+        from_chat_id: Chat the message is taken from
+        message_id: Message to broadcast
+        segment: Optional audience filters (see _segment_conditions), plus
+            'all' to include unreachable users
+        text: Text or caption to send instead of the message's own
+        entities: Formatting of `text` (MessageEntity dictionaries)
+        
+    Returns:
+        Job ID (0 on error)
+    """
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                INSERT INTO broadcast_jobs 
+                (mode, from_chat_id, message_id, status, created_at, segment, text, entities)
+                VALUES (?, ?, ?, 'pending', ?, ?, ?, ?)
+            """, (mode, from_chat_id, message_id, int(time.time()),
+                  json.dumps(segment) if segment else None, text,
+                  json.dumps(entities) if entities else None))
+            conn.commit()
+            return cursor.lastrowid
+    except Exception as e:
+        print(f"❌ Error creating broadcast job: {e}")
+        return 0
+
+
+def _broadcast_job_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    """Convert a broadcast_jobs row to a dictionary, decoding its segment and entities."""
+    job = dict(row)
+    job['segment'] = json.loads(job['segment']) if job['segment'] else {}
+    job['entities'] = json.loads(job['entities']) if job['entities'] else []
+    return job
+
+
+def claim_broadcast_job(owner: str, lease_seconds: int) -> Optional[Dict[str, Any]]:
+    """
+    Atomically claim the oldest runnable broadcast job.
+    
+    A job is runnable if it is pending, or running under a lease that
+    expired (its worker died); the new owner resumes from its cursor.
+    
+    Args:
+        owner: Unique worker identifier
+        lease_seconds: How long the claim is valid without progress updates
+        
+    Returns:
+        Job dictionary, or None if there is nothing to run
+    """
+    now = int(time.time())
+    
+    try:
+        with get_db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("""
+                SELECT * FROM broadcast_jobs 
+                WHERE status = 'pending'
+                   OR (status = 'running' AND lease_expires <= ?)
+                ORDER BY id ASC
+                LIMIT 1
+            """, (now,)).fetchone()
+            
+            if row is None:
+                conn.rollback()
+                return None
+            
+            conn.execute("""
+                UPDATE broadcast_jobs 
+                SET status = 'running', lease_owner = ?, lease_expires = ?
+                WHERE id = ?
+            """, (owner, now + lease_seconds, row['id']))
+            conn.commit()
+            
+            job = _broadcast_job_from_row(row)
+            job['status'] = 'running'
+            job['lease_owner'] = owner
+            return job
+    except Exception as e:
+        print(f"❌ Error claiming broadcast job: {e}")
+        return None
+
+
+def update_broadcast_progress(job_id: int, owner: str, cursor: int, sent: int, blocked: int, failed: int,
+                              dead_chat_ids: List[int], lease_seconds: int,
+                              concurrency: Optional[int] = None, rate: Optional[float] = None) -> bool:
+    """
+    Record a finished batch of a broadcast job.
+    
+    Advances the cursor, adds the batch's counts, renews the lease and flags
+    the batch's unreachable chats, all in one transaction, so a restarted
+    job resumes right after the last recorded batch. Nothing is written
+    unless `owner` still holds the job's lease.
+    
+    Args:
+        job_id: Broadcast job ID
+        owner: Worker that claimed the job
+        cursor: Last chat ID of the batch in the segment's paging order (by chat_id,
+            or by (key, chat_id) for payload and date segments; see _segment_page)
+        sent: Messages delivered in the batch
+        blocked: Unreachable recipients in the batch
+        failed: Other failures in the batch
+        dead_chat_ids: Chat IDs to mark unreachable
+        lease_seconds: Lease extension from now
+        concurrency: Current send concurrency (None = unchanged)
+        rate: Current target send rate of all bots in messages/second (None = unchanged)
+        
+    Returns:
+        True if recorded, False if the lease was lost (or on error)
+    """
+    try:
+        with get_db() as conn:
+            updated = conn.execute("""
+                UPDATE broadcast_jobs 
+                SET cursor = ?, sent = sent + ?, blocked = blocked + ?, failed = failed + ?,
+                    lease_expires = ?,
+                    concurrency = COALESCE(?, concurrency),
+                    rate = COALESCE(?, rate)
+                WHERE id = ? AND lease_owner = ?
+            """, (cursor, sent, blocked, failed, int(time.time()) + lease_seconds,
+                  concurrency, rate, job_id, owner)).rowcount
+            
+            if not updated:
+                conn.rollback()
+                return False
+            
+            if dead_chat_ids:
+                _mark_chats_unreachable(conn, dead_chat_ids, "broadcast: chat unreachable")
+            
+            conn.commit()
+        return True
+    except Exception as e:
+        print(f"❌ Error updating broadcast progress: {e}")
+        return False
+
+
+def renew_broadcast_lease(job_id: int, owner: str, lease_seconds: int) -> bool:
+    """
+    Extend a running job's lease while a slow batch is still sending.
+    
+    Returns:
+        True if `owner` still holds the lease, False if it was lost (or on error)
+    """
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                UPDATE broadcast_jobs SET lease_expires = ? 
+                WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """, (int(time.time()) + lease_seconds, job_id, owner))
+            conn.commit()
+            return cursor.rowcount == 1
+    except Exception as e:
+        print(f"❌ Error renewing broadcast lease: {e}")
+        return False
+
+
+def finish_broadcast_job(job_id: int, owner: str) -> bool:
+    """Mark a broadcast job as done, if `owner` still holds its lease."""
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                UPDATE broadcast_jobs 
+                SET status = 'done', finished_at = ?, lease_owner = NULL, lease_expires = NULL
+                WHERE id = ? AND lease_owner = ?
+            """, (int(time.time()), job_id, owner))
+            conn.commit()
+            return cursor.rowcount == 1
+    except Exception as e:
+        print(f"❌ Error finishing broadcast job: {e}")
+        return False
+
+
+def register_worker(worker_id: str, stale_after: int) -> int:
+    """
+    Record that a worker is alive and count the live workers.
+    
+    Workers not seen for `stale_after` seconds (crashed, or stopped without
+    unregistering) are removed.
+    
+    Args:
+        worker_id: Unique worker identifier
+        stale_after: Seconds after which a silent worker no longer counts
+        
+    Returns:
+        Number of live workers, including this one (0 on error)
+    """
+    now = int(time.time())
+    
+    try:
+        with get_db() as conn:
+            conn.execute("""
+                INSERT INTO workers (id, seen_at) VALUES (?, ?)
+                ON CONFLICT (id) DO UPDATE SET seen_at = excluded.seen_at
+            """, (worker_id, now))
+            conn.execute("DELETE FROM workers WHERE seen_at < ?", (now - stale_after,))
+            live = conn.execute("SELECT COUNT(*) FROM workers").fetchone()[0]
+            conn.commit()
+            return live
+    except Exception as e:
+        print(f"❌ Error registering worker: {e}")
+        return 0
+
+
+def unregister_worker(worker_id: str) -> bool:
+    """Remove a stopping worker, so the others take over its send budget."""
+    try:
+        with get_db() as conn:
+            conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+            conn.commit()
+        return True
+    except Exception as e:
+        print(f"❌ Error unregistering worker: {e}")
+        return False
+
+
+def get_broadcast_jobs(limit: int = 5) -> List[Dict[str, Any]]:
+    """Get the most recent broadcast jobs with their progress."""
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT ?
+            """, (limit,))
+            return [_broadcast_job_from_row(row) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"❌ Error fetching broadcast jobs: {e}")
+        return []
+
+
+def _get_meta(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row else None
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value: Any):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def get_results_snapshot(limit: int) -> Dict[str, Any]:
+    """
+    Get the stored /results state.
+    
+    Args:
+        limit: Number of position updates to return
+        
+    Returns:
+        Dictionary with 'updates' (newest first), 'last_message_id' (last
+        channel message processed) and 'refreshed_at' (unix time, 0 = never)
+    """
+    snapshot = {"updates": [], "last_message_id": 0, "refreshed_at": 0}
+    
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                SELECT text FROM result_updates ORDER BY message_id DESC LIMIT ?
+            """, (limit,))
+            snapshot["updates"] = [row['text'] for row in cursor.fetchall()]
+            snapshot["last_message_id"] = int(_get_meta(conn, "results_last_message_id") or 0)
+            snapshot["refreshed_at"] = int(_get_meta(conn, "results_refreshed_at") or 0)
+    except Exception as e:
+        print(f"❌ Error loading results: {e}")
+    
+    return snapshot
+
+
+def save_results(updates: List[Tuple[int, str]], last_message_id: int, keep: int) -> bool:
+    """
+    Store newly fetched position updates and advance the feed position.
+    
+    Args:
+        updates: (message_id, cleaned text) pairs
+        last_message_id: Highest channel message ID processed
+        keep: Number of newest updates to keep (older ones are deleted)
+        
+    Returns:
+        True if successful
+    """
+    try:
+        with get_db() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO result_updates (message_id, text) VALUES (?, ?)
+            """, updates)
+            
+            conn.execute("""
+                DELETE FROM result_updates WHERE message_id NOT IN (
+                    SELECT message_id FROM result_updates ORDER BY message_id DESC LIMIT ?
+                )
+            """, (keep,))
+            
+            # Never move the position backwards
+            stored = int(_get_meta(conn, "results_last_message_id") or 0)
+            _set_meta(conn, "results_last_message_id", max(stored, last_message_id))
+            _set_meta(conn, "results_refreshed_at", int(time.time()))
+            conn.commit()
+        return True
+    except Exception as e:
+        print(f"❌ Error saving results: {e}")
+        return False
+
+
+def get_user_count(reachable_only: bool = False, segment: Optional[Dict[str, Any]] = None) -> int:
+    """Get total number of users (optionally only reachable ones, or a segment)."""
+    try:
+        conditions, params = _segment_conditions(reachable_only, segment)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        with get_db() as conn:
+            cursor = conn.execute(f"SELECT COUNT(*) as count FROM users {where}", params)
+            return cursor.fetchone()['count']
+    except Exception as e:
+        print(f"❌ Error getting user count: {e}")
+        return 0
+
+
+def get_task_stats() -> Dict[str, int]:
+    """
+    Get statistics about tasks, including archived ones.
+    
+    Returns:
+        Dictionary with task counts by status
+    """
+    try:
+        with get_db() as conn:
+            cursor = conn.execute("""
+                SELECT status, COUNT(*) as count 
+                FROM tasks 
+                GROUP BY status
+            """)
+            
+            stats = {
+                "pending": 0,
+                "in_flight": 0,
+                "sent": 0,
+                "failed": 0,
+                "cancelled": 0,
+                "expired": 0,
+                "total": 0
+            }
+            
+            for row in cursor.fetchall():
+                stats[row['status']] = row['count']
+                stats['total'] += row['count']
+            
+            # Finished tasks moved out of the hot table
+            for row in conn.execute("""
+                SELECT status, SUM(count) AS count 
+                FROM task_archive 
+                GROUP BY status
+            """):
+                stats[row['status']] = stats.get(row['status'], 0) + row['count']
                 stats['total'] += row['count']
             
             return stats
     except Exception as e:
         print(f"❌ Error getting task stats: {e}")
-        return {"pending": 0, "sent": 0, "failed": 0, "cancelled": 0, "total": 0}
+        return {"pending": 0, "in_flight": 0, "sent": 0, "failed": 0, "cancelled": 0, "expired": 0, "total": 0}
@@ -0,0 +1,62 @@
+#!/bin/bash
+# Enable incremental vacuum on an existing database (one-time maintenance)
+# Databases created by a current version already have it. Older ones need a
+# full VACUUM, which rewrites the file and locks it, so both services are
+# stopped while it runs.
+
+echo "🧹 ENABLE INCREMENTAL VACUUM"
+echo "============================"
+echo ""
+echo "This will:"
+echo "  1. Stop both bot services"
+echo "  2. Backup existing database"
+echo "  3. VACUUM the database with auto_vacuum=INCREMENTAL"
+echo "  4. Restart services"
+echo ""
+
+read -p "Are you sure you want to continue? (yes/no): " confirm
+
+if [ "$confirm" != "yes" ]; then
+    echo "❌ Cancelled"
+    exit 0
+fi
+
+cd /opt/telegram-bot || { echo "❌ /opt/telegram-bot does not exist!"; exit 1; }
+
+if [ ! -f "storage/bot.db" ]; then
+    echo "❌ No database at storage/bot.db"
+    exit 1
+fi
+
+echo ""
+echo "1️⃣  Stopping services..."
+sudo systemctl stop telegram-bot
+sudo systemctl stop telegram-worker
+echo "✅ Services stopped"
+
+echo ""
+echo "2️⃣  Backing up database..."
+timestamp=$(date +%Y%m%d_%H%M%S)
+backup_file="storage/bot.db.backup_${timestamp}"
+cp storage/bot.db "$backup_file"
+echo "✅ Backup created: $backup_file"
+
+echo ""
+echo "3️⃣  Running VACUUM (may take a while on a large database)..."
+if sudo -u botuser venv/bin/python -c "import sys; from database import enable_incremental_vacuum; sys.exit(0 if enable_incremental_vacuum() else 1)"; then
+    echo "✅ Incremental vacuum enabled"
+else
+    echo "❌ VACUUM failed, database left as it was"
+fi
+
+echo ""
+echo "4️⃣  Restarting services..."
+sudo systemctl start telegram-bot
+sleep 2
+sudo systemctl start telegram-worker
+sleep 2
+
+echo ""
+echo "📊 Service Status:"
+systemctl is-active --quiet telegram-bot && echo "  ✅ Bot: RUNNING" || echo "  ❌ Bot: STOPPED"
+systemctl is-active --quiet telegram-worker && echo "  ✅ Worker: RUNNING" || echo "  ❌ Worker: STOPPED"
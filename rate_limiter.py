@@ -0,0 +1,160 @@
+"""
+Outgoing message rate limiter
+Token buckets for Telegram's global messages-per-second budget and the
+per-chat budget, shared by the worker and the broadcast handlers.
+"""
+
+import os
+import time
+import asyncio
+from typing import Dict, Optional
+
+# How often refilled (idle) per-chat buckets are dropped, in seconds
+PRUNE_INTERVAL = 60
+
+
+class TokenBucket:
+    """
+    Reservation-based token bucket.
+
+    Every caller reserves a token up front and is told how long to wait for
+    it, so waiters are served in FIFO order without a lock.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take one token and return how many seconds to wait before using it."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def set_rate(self, rate: float):
+        """Change the refill rate from now on (tokens earned so far are kept)."""
+        self._refill(time.monotonic())
+        self.rate = rate
+
+    def pause(self, seconds: float):
+        """
+        Hand out no tokens for `seconds`, without a burst afterwards.
+
+        Recorded as a debt of `seconds` worth of tokens, so reservations
+        stay FIFO: the next one waits out the pause, later ones follow at
+        the normal rate. Overlapping pauses do not add up.
+        """
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self, now: float) -> bool:
+        """True if the bucket has refilled completely (no state worth keeping)."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """
+    Global + per-chat rate limiter for one bot token.
+
+    Rates default to RATE_LIMIT_GLOBAL / RATE_LIMIT_PER_CHAT, read when the
+    limiter is created (i.e. after the caller's load_dotenv). Telegram allows
+    ~30 messages/second per bot and ~1 message/second per chat. That budget
+    is per bot, so with several worker processes each takes its share (see
+    set_share). Broadcasts lower the global rate below the share while
+    Telegram pushes back (see broadcast.AdaptiveRate).
+    """
+
+    def __init__(self, global_rate: Optional[float] = None, per_chat_rate: Optional[float] = None,
+                 global_burst: Optional[float] = None, per_chat_burst: float = 1):
+        if global_rate is None:
+            global_rate = float(os.getenv("RATE_LIMIT_GLOBAL", "30"))
+        if per_chat_rate is None:
+            per_chat_rate = float(os.getenv("RATE_LIMIT_PER_CHAT", "1"))
+
+        self.configured_rate = global_rate
+        self.max_rate = global_rate
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self._global_burst = global_burst or global_rate
+        self._global = TokenBucket(global_rate, self._global_burst)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._not_before: Dict[int, float] = {}
+        self._last_prune = time.monotonic()
+
+    async def acquire(self, chat_id: int):
+        """Wait until one message may be sent to chat_id."""
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self._chats[chat_id] = bucket
+
+        # Honour a FloodWait reported for this chat (expired entries are pruned)
+        not_before = self._not_before.get(chat_id)
+        if not_before is not None:
+            delay = not_before - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        # Per-chat wait first, so a slow chat does not hold a global token
+        delay = bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        delay = self._global.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        self._prune()
+
+    @property
+    def rate(self) -> float:
+        """Current global rate in messages per second."""
+        return self._global.rate
+
+    def set_rate(self, rate: float):
+        """Set the global rate, capped at this process's share of RATE_LIMIT_GLOBAL."""
+        self._global.set_rate(min(rate, self.max_rate))
+
+    def reset_rate(self):
+        """Go back to the full share (e.g. after a broadcast backed off)."""
+        self._global.set_rate(self.max_rate)
+
+    def set_share(self, workers: int):
+        """
+        Take 1/workers of the configured global rate and burst.
+
+        Every live worker process sends from the same bots, so without this
+        N workers would send at N x RATE_LIMIT_GLOBAL. A rate lowered by a
+        broadcast stays lowered (up to the new share).
+        """
+        backed_off = self.rate < self.max_rate
+        self.max_rate = self.configured_rate / max(1, workers)
+        self._global.capacity = max(1.0, self._global_burst / max(1, workers))
+        self._global.set_rate(min(self.rate, self.max_rate) if backed_off else self.max_rate)
+
+    def pause(self, seconds: float):
+        """Block all sends of this bot for `seconds` (a FloodWait applies to the whole bot)."""
+        self._global.pause(seconds)
+
+    def defer(self, chat_id: int, seconds: float):
+        """Block sends to chat_id for `seconds` (after a RetryAfter from Telegram)."""
+        until = time.monotonic() + seconds
+        self._not_before[chat_id] = max(until, self._not_before.get(chat_id, 0))
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+
+        self._last_prune = now
+        for chat_id in [c for c, b in self._chats.items() if b.is_idle(now)]:
+            del self._chats[chat_id]
+        for chat_id in [c for c, t in self._not_before.items() if t <= now]:
+            del self._not_before[chat_id]
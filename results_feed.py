@@ -0,0 +1,282 @@
+"""
+Trading results feed for /results
+The bot process owns one long-lived Telethon client. Rendered results are
+served from memory; once they are older than RESULTS_CACHE_HOURS a single
+background refresh is started while callers keep getting the stale text
+(stale-while-revalidate), so concurrent /results never pile up MTProto calls.
+Parsed updates and the last processed message ID are kept in SQLite, so a
+refresh only fetches newer messages and a restart starts warm.
+
+While the client is connected, new and edited channel messages are pushed
+to it (events.NewMessage / MessageEdited) and ingested one at a time, so
+/results is a plain in-memory read. The incremental poll still runs every
+RESULTS_CACHE_HOURS as a fallback: pushes only arrive while the account is
+in the channel, and Telethon does not backfill messages missed while it
+was disconnected. Pushes therefore never advance the poll's min_id.
+"""
+
+import os
+import time
+import asyncio
+from typing import List, Optional
+
+from async_storage import get_results_snapshot, save_results
+
+RESULTS_CHANNEL = "wazirforexalerts"
+RESULTS_LIMIT = 5  # Position updates shown by /results
+SCAN_LIMIT = 100  # Most channel messages scanned per fetch
+RESULTS_KEEP = 20  # Position updates kept in the database
+SESSION_FILE = "user_session"  # Created by setup_telethon.py
+
+
+class ResultsUnavailable(Exception):
+    """Results can not be fetched as configured; the message is shown to the user."""
+
+
+def parse_position_update(text: Optional[str]) -> Optional[str]:
+    """
+    Clean up a channel message if it is a closed position update.
+
+    Returns:
+        Cleaned text with a ✅/❌ marker, or None if the message is not a
+        "Position Status" with "Take Profit" or "Hit SL"
+    """
+    if not text:
+        return None
+
+    # Filter: Must have "Position Status"
+    if "Position Status" not in text:
+        return None
+
+    # Filter: Must have "Take Profit" OR "Hit SL"
+    if not ("Take Profit" in text or "Hit SL" in text):
+        return None
+
+    # Clean the message
+    clean_text = text
+    clean_text = clean_text.replace("Any inquiries Dm @zubarekhan01", "")
+    clean_text = clean_text.replace("WAZIR FOREX ALERTS", "")
+
+    # Remove extra blank lines
+    lines = [line.strip() for line in clean_text.split('\n') if line.strip()]
+    clean_text = '\n'.join(lines)
+
+    # Add emoji based on result type
+    if "Take Profit" in clean_text:
+        clean_text = "✅ " + clean_text
+    elif "Hit SL" in clean_text:
+        clean_text = "❌ " + clean_text
+
+    return clean_text
+
+
+def render_results(position_updates: List[str]) -> str:
+    """Format position updates (newest first) for /results."""
+    if not position_updates:
+        return "⚠️ No position status updates found."
+
+    # Format with separators
+    separator = "\n" + "─" * 30 + "\n\n"
+    final_message = separator.join(position_updates)
+    return f"📊 **Latest Trading Results**\n{separator}{final_message}"
+
+
+class ResultsFeed:
+    """Cached /results text backed by a persistent Telethon client."""
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._client = None
+        self._text: Optional[str] = None
+        self._fetched_at = 0.0
+        self._last_message_id = 0
+        self._subscribed = False
+        self._refresh: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """True if results can be served without waiting for Telegram."""
+        return self._text is not None
+
+    async def start(self):
+        """Load stored results and connect the client (called from the bot's post_init)."""
+        snapshot = await get_results_snapshot(RESULTS_LIMIT)
+        self._last_message_id = snapshot["last_message_id"]
+        if snapshot["refreshed_at"]:
+            self._text = render_results(snapshot["updates"])
+            self._fetched_at = snapshot["refreshed_at"]
+            print(f"📊 Loaded {len(snapshot['updates'])} stored results")
+
+        try:
+            client = await self._get_client()
+            self._subscribe(client)
+            print("✅ Results feed connected, listening for new results")
+
+            # Catch up on messages posted while the bot was down
+            self._start_refresh()
+        except ResultsUnavailable as e:
+            print(f"⚠️ Results feed unavailable: {e}")
+        except Exception as e:
+            print(f"⚠️ Results feed could not connect: {e}")
+
+    async def stop(self):
+        """Cancel a running refresh and disconnect (called from post_shutdown)."""
+        if self._refresh is not None and not self._refresh.done():
+            self._refresh.cancel()
+
+        if self._client is not None:
+            await self._client.disconnect()
+            self._client = None
+
+    async def get(self) -> str:
+        """
+        Current results text.
+
+        Returns at once when results are cached, starting a background
+        refresh if they are stale; only the very first call waits for a fetch.
+
+        Raises:
+            ResultsUnavailable: Telethon is not installed or not set up
+        """
+        if self._text is None:
+            # Cold start: every caller waits on the same fetch
+            await asyncio.shield(self._start_refresh())
+            return self._text
+
+        # Pushed updates keep the text fresh between polls, but can miss messages
+        if time.time() - self._fetched_at >= self.max_age:
+            self._start_refresh()
+        return self._text
+
+    def _start_refresh(self) -> asyncio.Task:
+        """Start a refresh unless one is already running (single flight)."""
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._do_refresh())
+            self._refresh.add_done_callback(self._log_refresh_error)
+        return self._refresh
+
+    def _log_refresh_error(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is None:
+            return
+        if self._text is not None:
+            # Keep serving the previous results
+            print(f"⚠️ Results refresh failed, serving cached results: {error}")
+        else:
+            # Nothing cached yet (e.g. the startup catch-up failed)
+            print(f"⚠️ Results refresh failed: {error}")
+
+    async def _do_refresh(self):
+        started = time.time()
+        client = await self._get_client()
+
+        # Newest first, and only messages after the last one processed
+        scanned = 0
+        last_message_id = self._last_message_id
+        position_updates = []
+        async for message in client.iter_messages(
+            RESULTS_CHANNEL, limit=SCAN_LIMIT, min_id=self._last_message_id
+        ):
+            scanned += 1
+            last_message_id = max(last_message_id, message.id)
+
+            clean_text = parse_position_update(message.text)
+            if clean_text is None:
+                continue
+
+            position_updates.append((message.id, clean_text))
+
+            # Older messages can not make it into the newest RESULTS_LIMIT
+            if len(position_updates) >= RESULTS_LIMIT:
+                break
+
+        await save_results(position_updates, last_message_id, RESULTS_KEEP)
+        snapshot = await get_results_snapshot(RESULTS_LIMIT)
+
+        self._last_message_id = max(self._last_message_id, last_message_id)
+        self._text = render_results(snapshot["updates"])
+        self._fetched_at = time.time()
+        print(f"📊 Results refreshed in {time.time() - started:.1f}s "
+              f"({scanned} new messages, {len(position_updates)} results)")
+
+    def _subscribe(self, client):
+        """Ingest new and edited messages of the results channel as they arrive."""
+        if self._subscribed:
+            return
+
+        from telethon import events
+
+        client.add_event_handler(self._on_message, events.NewMessage(chats=RESULTS_CHANNEL))
+        client.add_event_handler(self._on_message, events.MessageEdited(chats=RESULTS_CHANNEL))
+        self._subscribed = True
+
+    async def _on_message(self, event):
+        message = event.message
+        clean_text = parse_position_update(message.text)
+        if clean_text is None:
+            return
+
+        # The feed position is left to the poll: messages missed before this
+        # one (e.g. while disconnected) must still be above its min_id
+        try:
+            await save_results([(message.id, clean_text)], self._last_message_id, RESULTS_KEEP)
+            snapshot = await get_results_snapshot(RESULTS_LIMIT)
+            self._text = render_results(snapshot["updates"])
+            print(f"📊 New result ingested (message {message.id})")
+        except Exception as e:
+            print(f"❌ Error ingesting result: {e}")
+
+    async def _get_client(self):
+        """Return the connected client, creating or reconnecting it if needed."""
+        if self._client is not None:
+            if not self._client.is_connected():
+                await self._client.connect()
+            return self._client
+
+        try:
+            from telethon import TelegramClient  # Use async client
+        except ImportError:
+            raise ResultsUnavailable(
+                "❌ Telethon not installed.\n\n"
+                "Run: `pip install telethon`"
+            )
+
+        # Get API credentials from environment
+        api_id = os.getenv("TELEGRAM_API_ID")
+        api_hash = os.getenv("TELEGRAM_API_HASH")
+        phone = os.getenv("TELEGRAM_PHONE")
+
+        if not api_id or not api_hash:
+            raise ResultsUnavailable(
+                "❌ Missing Telethon credentials!\n\n"
+                "Add to .env:\n"
+                "TELEGRAM_API_ID=your_id\n"
+                "TELEGRAM_API_HASH=your_hash\n"
+                "TELEGRAM_PHONE=+1234567890\n\n"
+                "Get API credentials from: https://my.telegram.org"
+            )
+
+        if not phone:
+            raise ResultsUnavailable(
+                "❌ Missing phone number!\n\n"
+                "Add to .env:\n"
+                "TELEGRAM_PHONE=+1234567890\n\n"
+                "(Your personal Telegram phone number)"
+            )
+
+        client = TelegramClient(SESSION_FILE, int(api_id), api_hash)
+        await client.connect()
+
+        # Check if already authorized
+        if not await client.is_user_authorized():
+            await client.disconnect()
+            raise ResultsUnavailable(
+                "⚠️ First-time setup required!\n\n"
+                "Run: python setup_telethon.py\n"
+                "Complete phone verification, then restart bot."
+            )
+
+        self._client = client
+        return client
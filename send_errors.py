@@ -0,0 +1,78 @@
+"""
+Send error taxonomy
+Maps telegram.error exceptions to how the sender should react, so the worker
+and broadcasts never retry a send that can not succeed.
+"""
+
+from telegram.error import RetryAfter, Forbidden, BadRequest, ChatMigrated
+
+# Outcome kinds
+PERMANENT = "permanent"        # Retrying can never succeed (blocked, chat/message not found)
+TRANSIENT = "transient"        # Network trouble or server error, retry later with backoff
+RATE_LIMITED = "rate_limited"  # FloodWait, retry after e.retry_after
+
+# BadRequest descriptions that can only refer to the recipient. Others, like
+# "chat not found", are also returned when the source channel of copyMessage
+# is inaccessible, and must not condemn the recipient
+_DEAD_CHAT_MESSAGES = (
+    "user is deactivated",
+)
+
+# Forbidden descriptions about a channel or group the bot is not in (e.g.
+# the source channel), not about the private chat being sent to
+_NOT_RECIPIENT_FORBIDDEN = (
+    "not a member",
+    "kicked from"
+)
+
+
+class PermanentSendError(Exception):
+    """A task that can not be sent as configured (e.g. missing message id)."""
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Classify a send error.
+
+    Args:
+        error: Exception raised by a Bot API call
+
+    Returns:
+        PERMANENT, TRANSIENT or RATE_LIMITED
+    """
+    if isinstance(error, RetryAfter):
+        return RATE_LIMITED
+
+    if isinstance(error, (PermanentSendError, Forbidden, ChatMigrated)):
+        return PERMANENT
+
+    # Bad requests (chat or source message not found, ...) fail the same way every time
+    if isinstance(error, BadRequest):
+        return PERMANENT
+
+    # Timeouts, network trouble, server errors and anything unexpected
+    return TRANSIENT
+
+
+def is_chat_unreachable(error: Exception) -> bool:
+    """
+    True if the error means the recipient blocked the bot or no longer exists.
+
+    Deliberately narrow: the caller marks the chat unreachable and cancels
+    all its tasks, so a configuration error (e.g. a bot without access to
+    the source channel) must only fail the single send.
+    """
+    if isinstance(error, Forbidden):
+        error_msg = str(error).lower()
+        return not any(message in error_msg for message in _NOT_RECIPIENT_FORBIDDEN)
+
+    if isinstance(error, BadRequest):
+        error_msg = str(error).lower()
+        return any(message in error_msg for message in _DEAD_CHAT_MESSAGES)
+
+    return False
+
+
+def describe_error(error: Exception) -> str:
+    """Short description of an error for the task row and logs."""
+    return f"{classify_error(error)}: {type(error).__name__}: {error}"[:200]
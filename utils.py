@@ -5,29 +5,61 @@ Now uses SQLite database instead of JSON for better scalability and concurrency.
 
 import os
 from pathlib import Path
-from typing import List, Dict, Any
+from array import array
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 import time
 
 # Import database functions
 from database import (
     init_db,
+    DEFAULT_CAMPAIGN,
+    save_campaign as db_save_campaign,
+    set_campaign_active as db_set_campaign_active,
+    get_campaigns as db_get_campaigns,
     add_user as db_add_user,
+    add_user_if_new as db_add_user_if_new,
+    user_exists as db_user_exists,
     get_all_users as db_get_all_users,
+    get_user_chat_id_page as db_get_user_chat_id_page,
+    get_broadcast_recipients as db_get_broadcast_recipients,
+    iter_user_chat_ids as db_iter_user_chat_ids,
     create_task as db_create_task,
+    create_tasks as db_create_tasks,
+    register_user as db_register_user,
     get_pending_tasks as db_get_pending_tasks,
+    claim_due_tasks as db_claim_due_tasks,
+    get_next_due_time as db_get_next_due_time,
     update_task_status as db_update_task_status,
+    defer_tasks as db_defer_tasks,
+    expire_stale_tasks as db_expire_stale_tasks,
+    archive_finished_tasks as db_archive_finished_tasks,
+    vacuum_free_pages as db_vacuum_free_pages,
     cancel_user_tasks as db_cancel_user_tasks,
+    mark_chats_unreachable as db_mark_chats_unreachable,
+    create_broadcast_job as db_create_broadcast_job,
+    claim_broadcast_job as db_claim_broadcast_job,
+    update_broadcast_progress as db_update_broadcast_progress,
+    renew_broadcast_lease as db_renew_broadcast_lease,
+    finish_broadcast_job as db_finish_broadcast_job,
+    get_broadcast_jobs as db_get_broadcast_jobs,
+    register_worker as db_register_worker,
+    unregister_worker as db_unregister_worker,
+    get_results_snapshot as db_get_results_snapshot,
+    save_results as db_save_results,
     get_user_count as db_get_user_count,
     get_task_stats as db_get_task_stats
 )
+from wakeup import notify_workers, notify_broadcast
+from campaigns import schedule as campaign_schedule
 
 # Keep storage directory for compatibility
 STORAGE_DIR = Path(os.getenv("STORAGE_DIR", "./storage"))
 
 
 def ensure_storage():
-    """Initialize database (replaces JSON file creation)."""
+    """Initialize database (replaces JSON file creation) and the default campaign."""
     init_db()
+    seed_default_campaign()
 
 
 
@@ -40,24 +72,94 @@ def add_user(user_data: Dict[str, Any]) -> bool:
     return db_add_user(user_data)
 
 
-def get_all_users() -> List[Dict[str, Any]]:
+def add_user_if_new(user_data: Dict[str, Any]) -> bool:
+    """Add user to database unless they exist; True if inserted (raises on DB errors)."""
+    return db_add_user_if_new(user_data)
+
+
+def user_exists(chat_id: int) -> bool:
+    """Check whether a user exists in database (raises on DB errors)."""
+    return db_user_exists(chat_id)
+
+
+def get_all_users(reachable_only: bool = False) -> List[Dict[str, Any]]:
     """Get all users from database."""
-    return db_get_all_users()
+    return db_get_all_users(reachable_only)
+
+
+def get_user_chat_id_page(after: Optional[int], limit: int, reachable_only: bool = True,
+                          segment: Optional[Dict[str, Any]] = None) -> array:
+    """Get one keyset page of user chat IDs after `after`."""
+    return db_get_user_chat_id_page(after, limit, reachable_only, segment)
 
 
-def create_task(chat_id: int, task_type: str, send_at: int, payload: Dict[str, Any]) -> str:
+def get_broadcast_recipients(after: Optional[int], limit: int, reachable_only: bool = True,
+                             segment: Optional[Dict[str, Any]] = None) -> Tuple[array, array]:
+    """Get one keyset page of recipient chat IDs and their bot IDs."""
+    return db_get_broadcast_recipients(after, limit, reachable_only, segment)
+
+
+def iter_user_chat_ids(chunk_size: int = 1000, reachable_only: bool = True) -> Iterator[array]:
+    """Stream user chat IDs in compact chunks."""
+    return db_iter_user_chat_ids(chunk_size, reachable_only)
+
+
+def create_task(chat_id: int, step_id: int, send_at: int) -> Optional[int]:
     """Create a new scheduled task in database."""
-    return db_create_task(chat_id, task_type, send_at, payload)
+    task_id = db_create_task(chat_id, step_id, send_at)
+    if task_id:
+        notify_workers(send_at)
+    return task_id
+
+
+def create_tasks(rows: List[Dict[str, Any]]) -> List[int]:
+    """Create several scheduled tasks in one transaction."""
+    task_ids = db_create_tasks(rows)
+    if task_ids:
+        notify_workers(min(row["send_at"] for row in rows))
+    return task_ids
+
+
+def get_pending_tasks(limit: int = 1000) -> List[Dict[str, Any]]:
+    """Get the oldest due pending tasks (at most `limit`)."""
+    return db_get_pending_tasks(limit)
+
+
+def claim_due_tasks(owner: str, limit: int, lease_seconds: int) -> List[Dict[str, Any]]:
+    """Atomically lease due tasks to a worker."""
+    return db_claim_due_tasks(owner, limit, lease_seconds)
+
+
+def get_next_due_time() -> Optional[int]:
+    """Get the earliest time a worker will have a task to claim."""
+    return db_get_next_due_time()
+
+
+def update_task_status(task_id: int, status: str, increment_retry: bool = False,
+                       send_at: Optional[int] = None, last_error: Optional[str] = None,
+                       owner: Optional[str] = None) -> bool:
+    """Update task status in database (only while `owner` holds its lease, if given)."""
+    return db_update_task_status(task_id, status, increment_retry, send_at, last_error, owner)
+
+
+def defer_tasks(task_ids: List[int], not_before: int, owner: Optional[str] = None) -> int:
+    """Return claimed tasks to the queue with send_at pushed to not_before."""
+    return db_defer_tasks(task_ids, not_before, owner)
 
 
-def get_pending_tasks() -> List[Dict[str, Any]]:
-    """Get all pending tasks from database."""
-    return db_get_pending_tasks()
+def expire_stale_tasks(supersede_after: int) -> int:
+    """Expire overdue tasks past their freshness window or superseded by a later one."""
+    return db_expire_stale_tasks(supersede_after)
 
 
-def update_task_status(task_id: str, status: str, increment_retry: bool = False) -> bool:
-    """Update task status in database."""
-    return db_update_task_status(task_id, status, increment_retry)
+def archive_finished_tasks(before: int, batch_size: int = 1000) -> int:
+    """Move one batch of finished tasks due before `before` into the archive."""
+    return db_archive_finished_tasks(before, batch_size)
+
+
+def vacuum_free_pages(max_pages: int) -> int:
+    """Return up to max_pages free database pages to the file system."""
+    return db_vacuum_free_pages(max_pages)
 
 
 def cancel_user_tasks(chat_id: int) -> int:
@@ -65,9 +167,87 @@ def cancel_user_tasks(chat_id: int) -> int:
     return db_cancel_user_tasks(chat_id)
 
 
-def get_user_count() -> int:
+def mark_chats_unreachable(chat_ids: List[int], reason: str) -> int:
+    """Flag chats as blocked/deleted and cancel their queued tasks."""
+    return db_mark_chats_unreachable(chat_ids, reason)
+
+
+def create_broadcast_job(mode: str, from_chat_id: int, message_id: int,
+                         segment: Optional[Dict[str, Any]] = None, text: Optional[str] = None,
+                         entities: Optional[List[Dict[str, Any]]] = None) -> int:
+    """Queue a broadcast for the worker."""
+    job_id = db_create_broadcast_job(mode, from_chat_id, message_id, segment, text, entities)
+    if job_id:
+        notify_broadcast()
+    return job_id
+
+
+def claim_broadcast_job(owner: str, lease_seconds: int) -> Optional[Dict[str, Any]]:
+    """Atomically claim the oldest runnable broadcast job."""
+    return db_claim_broadcast_job(owner, lease_seconds)
+
+
+def update_broadcast_progress(job_id: int, owner: str, cursor: int, sent: int, blocked: int, failed: int,
+                              dead_chat_ids: List[int], lease_seconds: int,
+                              concurrency: Optional[int] = None, rate: Optional[float] = None) -> bool:
+    """Record a finished batch of a broadcast job; False if the lease was lost."""
+    return db_update_broadcast_progress(job_id, owner, cursor, sent, blocked, failed,
+                                        dead_chat_ids, lease_seconds, concurrency, rate)
+
+
+def renew_broadcast_lease(job_id: int, owner: str, lease_seconds: int) -> bool:
+    """Extend a running broadcast job's lease; False if it was lost."""
+    return db_renew_broadcast_lease(job_id, owner, lease_seconds)
+
+
+def finish_broadcast_job(job_id: int, owner: str) -> bool:
+    """Mark a broadcast job as done, if `owner` still holds its lease."""
+    return db_finish_broadcast_job(job_id, owner)
+
+
+def get_broadcast_jobs(limit: int = 5) -> List[Dict[str, Any]]:
+    """Get the most recent broadcast jobs."""
+    return db_get_broadcast_jobs(limit)
+
+
+def register_worker(worker_id: str, stale_after: int) -> int:
+    """Record that a worker is alive; returns the number of live workers."""
+    return db_register_worker(worker_id, stale_after)
+
+
+def unregister_worker(worker_id: str) -> bool:
+    """Remove a stopping worker."""
+    return db_unregister_worker(worker_id)
+
+
+def get_results_snapshot(limit: int) -> Dict[str, Any]:
+    """Get the stored /results updates and feed position."""
+    return db_get_results_snapshot(limit)
+
+
+def save_results(updates: List[Tuple[int, str]], last_message_id: int, keep: int) -> bool:
+    """Store fetched position updates and advance the feed position."""
+    return db_save_results(updates, last_message_id, keep)
+
+
+def get_user_count(reachable_only: bool = False, segment: Optional[Dict[str, Any]] = None) -> int:
     """Get total number of users."""
-    return db_get_user_count()
+    return db_get_user_count(reachable_only, segment)
+
+
+def save_campaign(name: str, start_payload: Optional[str], steps: List[Dict[str, Any]]) -> Optional[int]:
+    """Create or replace a drip campaign and activate it."""
+    return db_save_campaign(name, start_payload, steps)
+
+
+def set_campaign_active(name: str, active: bool) -> bool:
+    """Switch a drip campaign on or off."""
+    return db_set_campaign_active(name, active)
+
+
+def get_campaigns(active_only: bool = False) -> List[Dict[str, Any]]:
+    """Get drip campaigns with their active steps."""
+    return db_get_campaigns(active_only)
 
 
 def get_task_stats() -> Dict[str, int]:
@@ -78,26 +258,22 @@ def get_task_stats() -> Dict[str, int]:
 
 
 
-# Keep create_user_tasks as-is since it uses other functions
-
-
-def create_user_tasks(chat_id: int, start_time: int) -> List[str]:
+def get_default_campaign_steps() -> List[Dict[str, Any]]:
     """
-    Create all scheduled tasks for a new user.
+    Get the default drip schedule configured by MSG_*_ID.
+    
+    Every item has a freshness window (max_lateness): once a task is that
+    many seconds past its send_at it is expired rather than sent, so a
+    worker catching up after downtime does not fire outdated messages.
     
-    Args:
-        chat_id: Telegram chat ID
-        start_time: Unix timestamp of /start command
-        
     Returns:
-        List of created task IDs
+        List of schedule items with type, delay, max_lateness and the message to send
     """
     # Get configuration from environment
     source_channel_id = int(os.getenv("SOURCE_CHANNEL_ID", "0"))
     msg_30s_id = int(os.getenv("MSG_30S_ID", "0"))
     msg_3min_id = int(os.getenv("MSG_3MIN_ID", "0"))
     msg_2h_id = int(os.getenv("MSG_2H_ID", "0"))
-    target_channel_id = int(os.getenv("TARGET_CHANNEL_ID", "0"))
     
     # Task schedule with message IDs
     task_schedule = []
@@ -107,11 +283,10 @@ def create_user_tasks(chat_id: int, start_time: int) -> List[str]:
         task_schedule.append({
             "type": "msg_30s",
             "delay": 30,
-            "payload": {
-                "message_id": msg_30s_id,
-                "source_channel_id": source_channel_id,
-                "check_membership": False
-            }
+            "max_lateness": 15 * 60,
+            "source_channel_id": source_channel_id,
+            "message_id": msg_30s_id,
+            "check_membership": False
         })
     
     # Task 2: 3 minutes - Images + text
@@ -119,11 +294,10 @@ def create_user_tasks(chat_id: int, start_time: int) -> List[str]:
         task_schedule.append({
             "type": "msg_3min",
             "delay": 180,
-            "payload": {
-                "message_id": msg_3min_id,
-                "source_channel_id": source_channel_id,
-                "check_membership": False
-            }
+            "max_lateness": 30 * 60,
+            "source_channel_id": source_channel_id,
+            "message_id": msg_3min_id,
+            "check_membership": False
         })
     
     # Task 3: 2 hours - Final message (sent to ALL users)
@@ -132,28 +306,71 @@ def create_user_tasks(chat_id: int, start_time: int) -> List[str]:
         task_schedule.append({
             "type": "msg_2h",
             "delay": 7200,
-            "payload": {
-                "message_id": msg_2h_id,
-                "source_channel_id": source_channel_id,
-                "check_membership": False
-            }
+            "max_lateness": 6 * 3600,
+            "source_channel_id": source_channel_id,
+            "message_id": msg_2h_id,
+            "check_membership": False
         })
     
-    task_ids = []
+    return task_schedule
+
+
+def seed_default_campaign():
+    """
+    Save the MSG_*_ID schedule as the default campaign.
     
-    print(f"📋 Creating {len(task_schedule)} tasks for user {chat_id}:")
-    for schedule_item in task_schedule:
-        send_time = start_time + schedule_item["delay"]
-        task_id = create_task(
-            chat_id=chat_id,
-            task_type=schedule_item["type"],
-            send_at=send_time,
-            payload=schedule_item["payload"]
-        )
-        from datetime import datetime
-        send_time_str = datetime.fromtimestamp(send_time).strftime('%H:%M:%S')
-        print(f"  └─ {schedule_item['type']}: {schedule_item['delay']}s delay (at {send_time_str})")
-        task_ids.append(task_id)
+    Runs at startup (after load_dotenv). Without any MSG_*_ID the default
+    campaign is left as it is in the database, e.g. as edited with /campaign.
+    """
+    steps = get_default_campaign_steps()
+    if steps:
+        db_save_campaign(DEFAULT_CAMPAIGN, None, steps)
+
+
+def build_user_task_rows(chat_id: int, start_time: int,
+                         start_payload: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Build the task rows of the user's campaign starting at start_time."""
+    return [
+        {
+            "chat_id": chat_id,
+            "step_id": step_id,
+            "send_at": start_time + delay
+        }
+        for step_id, delay in campaign_schedule.steps_for(start_payload)
+    ]
+
+
+def create_user_tasks(chat_id: int, start_time: int, start_payload: Optional[str] = None) -> List[int]:
+    """
+    Create all scheduled tasks for a new user.
     
-    return task_ids
+    Args:
+        chat_id: Telegram chat ID
+        start_time: Unix timestamp of /start command
+        start_payload: Deep-link payload that selects the campaign
+        
+    Returns:
+        List of created task IDs
+    """
+    return create_tasks(build_user_task_rows(chat_id, start_time, start_payload))
+
 
+def register_user(user_data: Dict[str, Any], start_time: int) -> Optional[List[int]]:
+    """
+    Save a new user together with their drip tasks in one transaction.
+    
+    Args:
+        user_data: Dictionary with user information
+        start_time: Unix timestamp of /start command
+        
+    Returns:
+        List of created task IDs, or None if the user already existed
+        
+    Raises:
+        sqlite3.Error: The user and tasks could not be saved
+    """
+    rows = build_user_task_rows(user_data["chat_id"], start_time, user_data.get("start_payload"))
+    task_ids = db_register_user(user_data, rows)
+    if task_ids:
+        notify_workers(min(row["send_at"] for row in rows))
+    return task_ids
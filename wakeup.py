@@ -0,0 +1,124 @@
+"""
+Local wake-up channel between bot.py and worker.py
+Each worker binds a Unix datagram socket in storage/wake/; whenever new tasks
+are enqueued, the bot sends their earliest send_at to every worker socket so
+workers can sleep until exactly that time instead of polling. Queued
+broadcast jobs are announced the same way.
+"""
+
+import os
+import socket
+import asyncio
+from pathlib import Path
+from typing import Callable, Optional
+
+from database import DB_PATH
+
+WAKE_DIR = DB_PATH.parent / "wake"
+
+# Unix datagram sockets are not available on Windows; workers fall back to polling
+SUPPORTED = hasattr(socket, "AF_UNIX")
+
+# Datagram sent when a broadcast job is queued (task wake-ups carry a timestamp)
+BROADCAST_MESSAGE = b"broadcast"
+
+
+def notify_workers(send_at: int):
+    """
+    Tell every local worker that a task is due at send_at.
+
+    Best effort and non-blocking: a missing or busy worker is skipped, and
+    sockets left behind by dead workers are removed.
+    """
+    _send_to_workers(str(int(send_at)).encode())
+
+
+def notify_broadcast():
+    """Tell every local worker that a broadcast job was queued."""
+    _send_to_workers(BROADCAST_MESSAGE)
+
+
+def _send_to_workers(data: bytes):
+    if not SUPPORTED or not WAKE_DIR.is_dir():
+        return
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for path in WAKE_DIR.glob("worker-*.sock"):
+                try:
+                    sock.sendto(data, str(path))
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Nobody is listening any more
+                    path.unlink(missing_ok=True)
+                except OSError:
+                    # Receive buffer full: the worker already has wake-ups queued
+                    pass
+    except OSError as e:
+        print(f"⚠️ Could not notify worker: {e}")
+
+
+class WakeupListener:
+    """Receives send_at and broadcast notifications on this worker's socket."""
+
+    def __init__(self, on_wake: Callable[[int], None], on_broadcast: Optional[Callable[[], None]] = None):
+        self.on_wake = on_wake
+        self.on_broadcast = on_broadcast
+        self.path: Optional[Path] = None
+        self._sock: Optional[socket.socket] = None
+
+    def start(self) -> bool:
+        """
+        Bind the socket and register it with the running event loop.
+
+        Returns:
+            True if wake-ups are available, False if the worker must poll
+        """
+        if not SUPPORTED:
+            return False
+
+        try:
+            WAKE_DIR.mkdir(parents=True, exist_ok=True)
+            self.path = WAKE_DIR / f"worker-{os.getpid()}.sock"
+            self.path.unlink(missing_ok=True)
+
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(str(self.path))
+            sock.setblocking(False)
+            asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+            self._sock = sock
+            return True
+        except (OSError, NotImplementedError) as e:
+            print(f"⚠️ Wake-up socket unavailable, falling back to polling: {e}")
+            self.close()
+            return False
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(64)
+            except (BlockingIOError, InterruptedError):
+                return
+
+            if data == BROADCAST_MESSAGE:
+                if self.on_broadcast is not None:
+                    self.on_broadcast()
+                continue
+
+            try:
+                self.on_wake(int(data))
+            except ValueError:
+                pass
+
+    def close(self):
+        """Unregister and remove the socket."""
+        if self._sock is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._sock.fileno())
+            except RuntimeError:
+                pass
+            self._sock.close()
+            self._sock = None
+
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
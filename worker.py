@@ -5,180 +5,444 @@ Continuously monitors tasks.json and sends messages when due
 
 import os
 import time
+import heapq
+import random
+import socket
 import asyncio
+from collections import deque
+from typing import Dict, List, Optional
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.error import TelegramError, RetryAfter
+from telegram.error import RetryAfter
 from dotenv import load_dotenv
 
-from utils import (
-    get_pending_tasks,
+from utils import ensure_storage
+from async_storage import (
+    archive_finished_tasks,
+    claim_due_tasks,
+    defer_tasks,
+    expire_stale_tasks,
+    get_next_due_time,
+    mark_chats_unreachable,
+    register_worker,
+    unregister_worker,
     update_task_status,
-    ensure_storage
+    vacuum_free_pages
 )
+from bot_pool import BotNotConfigured, BotPool, load_tokens
+from broadcast import BroadcastRunner
+from rate_limiter import RateLimiter
+from send_errors import (
+    PERMANENT,
+    PermanentSendError,
+    classify_error,
+    describe_error,
+    is_chat_unreachable
+)
+from wakeup import WakeupListener
 
 # Load environment variables
 load_dotenv()
 
-BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHANNEL_URL = os.getenv("CHANNEL_URL", "https://t.me/your_channel")
 MAX_RETRIES = 3
-POLL_INTERVAL = 5  # Check for tasks every 5 seconds
+RETRY_BASE_DELAY = int(os.getenv("RETRY_BASE_DELAY_SECONDS", "60"))  # First retry after ~1 min
+RETRY_MAX_DELAY = int(os.getenv("RETRY_MAX_DELAY_SECONDS", "3600"))
+POLL_INTERVAL = 5  # Fallback check interval when wake-ups are unavailable
+MAX_IDLE_SLEEP = int(os.getenv("WORKER_MAX_IDLE_SECONDS", "60"))  # Safety net for other hosts' tasks
+
+# Task leasing: several workers can share the database without double-sending
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+CLAIM_BATCH_SIZE = int(os.getenv("WORKER_CLAIM_BATCH", "100"))
+LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "300"))  # Reclaimed after this if the worker dies
+
+# Concurrent dispatch: how many sends may be awaiting Telegram at once
+MAX_IN_FLIGHT = int(os.getenv("WORKER_CONCURRENCY", "20"))
+
+# Backpressure: claimed-but-unfinished tasks held in memory at most; new
+# pages are only claimed for free capacity (keep well under LEASE_SECONDS of work)
+QUEUE_CAPACITY = int(os.getenv("WORKER_QUEUE_CAPACITY", str(MAX_IN_FLIGHT * 10)))
+
+# How often overdue tasks past their step's freshness window are expired (campaign_steps.max_lateness)
+EXPIRY_SWEEP_INTERVAL = 60
+
+# A due task is only dropped for a later due message of the same chat once
+# it is this late; shorter delays (a /start burst, a restart) send both in order
+SUPERSEDE_AFTER = 10 * 60
+
+# Retention: finished tasks older than this are moved to task_archive (as
+# counts), keeping the tasks table sized to the live queue
+TASK_RETENTION_DAYS = int(os.getenv("TASK_RETENTION_DAYS", "7"))
+ARCHIVE_INTERVAL = 3600  # Seconds between retention runs
+ARCHIVE_BATCH_SIZE = 1000  # Tasks moved per transaction
+VACUUM_MAX_PAGES = 5000  # Free pages returned per retention run
 
+# Live workers share each bot's RATE_LIMIT_GLOBAL; a worker not seen for
+# WORKER_STALE_AFTER seconds (e.g. killed) stops counting
+WORKER_HEARTBEAT_INTERVAL = 15
+WORKER_STALE_AFTER = 60
 
-async def safe_send(bot, method_name, **kwargs):
+
+def retry_delay(retries: int) -> int:
     """
-    Safely send message with RetryAfter/FloodWait handling.
+    Backoff before the next attempt of a task that has failed `retries` times.
     
-    Args:
-        bot: Bot instance
-        method_name: Name of bot method to call (e.g., 'copy_message', 'send_message')
-        **kwargs: Arguments to pass to the method
-        
-    Returns:
-        Result of the method call or None if failed
+    Exponential from RETRY_BASE_DELAY up to RETRY_MAX_DELAY, with jitter so
+    failures from one burst do not all come back at the same second.
     """
-    max_attempts = 3
-    base_delay = 1.0
-    
-    for attempt in range(max_attempts):
-        try:
-            method = getattr(bot, method_name)
-            return await method(**kwargs)
-            
-        except RetryAfter as e:
-            # Telegram told us exactly how long to wait
-            wait_time = e.retry_after + 1
-            print(f"⚠️ FloodWait: Telegram requested {wait_time}s wait. Sleeping...")
-            await asyncio.sleep(wait_time)
-            
-        except TelegramError as e:
-            # Other Telegram errors - don't retry certain types
-            error_msg = str(e).lower()
-            if "blocked" in error_msg or "deactivated" in error_msg:
-                print(f"🚫 User blocked bot or deactivated")
-                return None
-            
-            # Retry on other errors with exponential backoff
-            if attempt < max_attempts - 1:
-                delay = base_delay * (2 ** attempt)
-                print(f"⚠️ Error: {e}. Retrying in {delay}s... (attempt {attempt + 1}/{max_attempts})")
-                await asyncio.sleep(delay)
-            else:
-                print(f"❌ Failed after {max_attempts} attempts: {e}")
-                return None
-                
-    return None
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** retries))
+    return int(delay * random.uniform(0.8, 1.2))
 
 
-
-async def send_task_message(bot: Bot, task: dict) -> bool:
+async def send_task_message(bot: Bot, task: dict):
     """
-    Send a scheduled task message by forwarding from source channel.
+    Send a scheduled task message by copying it from the source channel.
+    
+    A single attempt: errors are raised to handle_task, which classifies
+    them (see send_errors) and decides whether the task is retried.
     
     Args:
         bot: Telegram Bot instance
         task: Task dictionary
-        
-    Returns:
-        True if sent successfully, False otherwise
     """
     chat_id = task["chat_id"]
-    payload = task["payload"]
-    task_type = task.get("task_type", "")
     
-    try:
-        # Copy message from source channel (no "Forwarded from" tag)
-        source_channel_id = payload.get("source_channel_id")
-        message_id = payload.get("message_id")
-        
-        if not source_channel_id or not message_id:
-            print(f"❌ Missing source_channel_id or message_id in payload")
-            return False
+    # Copy message from source channel (no "Forwarded from" tag)
+    source_channel_id = task["source_channel_id"]
+    message_id = task["message_id"]
+    
+    if not source_channel_id or not message_id:
+        raise PermanentSendError(f"Missing source_channel_id or message_id on step {task['step_id']}")
+    
+    # Create dual-button layout: URL for direct access + callback for tracking
+    keyboard = [
+        [InlineKeyboardButton("⭐ Join Now", url=CHANNEL_URL)],
+        [InlineKeyboardButton("✅ I Joined", callback_data="join_channel")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    # Copy the message (removes "Forwarded from" attribution) with join button
+    await bot.copy_message(
+        chat_id=chat_id,
+        from_chat_id=source_channel_id,
+        message_id=message_id,
+        reply_markup=reply_markup
+    )
+
+
+class TaskRescheduled(Exception):
+    """A task failed transiently and was rescheduled to send_at."""
+    
+    def __init__(self, send_at: int):
+        super().__init__(f"rescheduled to {send_at}")
+        self.send_at = send_at
+
+
+async def handle_task(bot: Bot, task: dict):
+    """
+    Send one claimed task and record the outcome on its row.
+    
+    Permanent failures (blocked user, missing chat or source message) fail
+    at once; transient ones are retried with backoff up to MAX_RETRIES.
+    RetryAfter is raised to the dispatcher.
+    
+    Returns:
+        False if the chat turned out to be unreachable (its other tasks
+        were cancelled), True otherwise
         
+    Raises:
+        TaskRescheduled: The task was put back for a retry, so the chat's
+        later tasks have to wait for it
+    """
+    task_id = task["id"]
+    retries = task.get("retries", 0)
+    
+    print(f"📤 Sending task {task_id} (type: {task['task_type']}) to {task['chat_id']}")
+    
+    try:
+        await send_task_message(bot, task)
         
-        # Create dual-button layout: URL for direct access + callback for tracking
-        keyboard = [
-            [InlineKeyboardButton("⭐ Join Now", url=CHANNEL_URL)],
-            [InlineKeyboardButton("✅ I Joined", callback_data="join_channel")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    except RetryAfter:
+        raise
         
+    except Exception as e:
+        kind = classify_error(e)
+        error = describe_error(e)
         
-        # Copy the message (removes "Forwarded from" attribution) with join button
-        # Use safe_send to handle FloodWait/RetryAfter
-        result = await safe_send(
-            bot,
-            'copy_message',
-            chat_id=chat_id,
-            from_chat_id=source_channel_id,
-            message_id=message_id,
-            reply_markup=reply_markup
-        )
+        if kind == PERMANENT:
+            # Retrying can never succeed - don't spend another API call
+            await update_task_status(task_id, "failed", last_error=error, owner=WORKER_ID)
+            print(f"🚫 Task {task_id} failed permanently: {error}")
+            
+            if is_chat_unreachable(e):
+                cancelled = await mark_chats_unreachable([task["chat_id"]], error)
+                print(f"🚫 Chat {task['chat_id']} is unreachable, cancelled {cancelled} task(s)")
+                return False
+            
+        elif retries < MAX_RETRIES:
+            # Increment retry counter and reschedule with backoff
+            delay = retry_delay(retries)
+            send_at = int(time.time()) + delay
+            await update_task_status(
+                task_id, "pending", increment_retry=True,
+                send_at=send_at, last_error=error, owner=WORKER_ID
+            )
+            print(f"🔄 Task {task_id} failed ({error}), will retry in {delay}s (attempt {retries + 1}/{MAX_RETRIES})")
+            raise TaskRescheduled(send_at)
+            
+        else:
+            # Max retries exceeded, mark as failed
+            await update_task_status(task_id, "failed", last_error=error, owner=WORKER_ID)
+            print(f"❌ Task {task_id} failed after {MAX_RETRIES} attempts: {error}")
+        return True
+    
+    # Mark as sent (unless the lease ran out and another worker owns it now)
+    if not await update_task_status(task_id, "sent", owner=WORKER_ID):
+        print(f"⚠️ Task {task_id} sent after its lease expired")
+    print(f"✅ Task {task_id} sent successfully")
+    return True
+
+
+class Dispatcher:
+    """
+    Sends claimed tasks concurrently with a bounded in-flight window.
+    
+    Every send goes through the global and per-chat rate limiter of the
+    chat's bot (see BotPool). Tasks for the same chat are queued and sent
+    one after another in the order they were submitted; different chats
+    proceed in parallel. `pending` counts submitted tasks not yet handled,
+    which the scheduler loop keeps under its queue capacity.
+    """
+    
+    def __init__(self, pool: BotPool, max_in_flight: int):
+        self.pool = pool
+        self.pending = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._chat_queues: Dict[int, deque] = {}
+        self._runners = set()
+        self._capacity_freed = asyncio.Event()
+    
+    def submit(self, task: dict):
+        """Queue a task behind any earlier task for the same chat."""
+        self.pending += 1
+        chat_id = task["chat_id"]
+        queue = self._chat_queues.get(chat_id)
+        if queue is not None:
+            queue.append(task)
+            return
         
-        return result is not None
+        self._chat_queues[chat_id] = deque([task])
+        runner = asyncio.create_task(self._drain_chat(chat_id))
+        self._runners.add(runner)
+        runner.add_done_callback(self._runners.discard)
+    
+    async def _drain_chat(self, chat_id: int):
+        queue = self._chat_queues[chat_id]
+        try:
+            while queue:
+                task = queue.popleft()
+                try:
+                    bot, limiter = self.pool.get(task.get("bot_id"))
+                    # Wait for rate budget before taking an in-flight slot
+                    await limiter.acquire(chat_id)
+                    async with self._slots:
+                        try:
+                            if not await handle_task(bot, task):
+                                # Dead chat: its queued tasks were cancelled in the DB
+                                self._discard(queue)
+                        except RetryAfter as e:
+                            await self._defer_chat(chat_id, task, limiter, e.retry_after)
+                        except TaskRescheduled as e:
+                            # Later messages of this chat must not overtake the retry
+                            deferred = await self._defer_queued(chat_id, e.send_at)
+                            if deferred:
+                                print(f"🔄 Deferred {deferred} later task(s) of chat {chat_id} behind the retry")
+                        except Exception as e:
+                            # Leave the task leased; it is reclaimed when the lease expires
+                            print(f"❌ Error handling task {task['id']}: {e}")
+                except BotNotConfigured as e:
+                    # Only the removed helper could reach this chat: skip the task, keep the chat
+                    await update_task_status(task["id"], "failed", last_error=str(e), owner=WORKER_ID)
+                    print(f"🚫 Task {task['id']} skipped: {e}")
+                finally:
+                    self._release(1)
+        finally:
+            self._discard(queue)
+            del self._chat_queues[chat_id]
+    
+    def _discard(self, queue: deque):
+        """Drop queued tasks that are handled elsewhere (cancelled or deferred in the DB)."""
+        self._release(len(queue))
+        queue.clear()
+    
+    def _release(self, count: int):
+        if count:
+            self.pending -= count
+            self._capacity_freed.set()
+    
+    async def wait_for_capacity(self, capacity: int) -> int:
+        """
+        Wait until fewer than `capacity` tasks are pending.
         
-    except TelegramError as e:
-        error_msg = str(e)
+        Returns:
+            Number of tasks that may be submitted now
+        """
+        while self.pending >= capacity:
+            self._capacity_freed.clear()
+            await self._capacity_freed.wait()
+        return capacity - self.pending
+    
+    async def _defer_chat(self, chat_id: int, task: dict, limiter: RateLimiter, retry_after: int):
+        """
+        Push a flood-limited chat's tasks back to the queue.
         
-        # Check if user blocked bot or deleted account
-        if "blocked" in error_msg.lower() or "user is deactivated" in error_msg.lower():
-            print(f"🚫 User {chat_id} blocked bot or account deactivated")
-            return False  # Don't retry
+        The failed task and everything queued behind it for this chat are
+        returned to 'pending' with send_at moved past the FloodWait, keeping
+        their order. The bot's other sends wait the FloodWait out in its rate
+        limiter (it applies to the whole bot), without touching their tasks.
+        """
+        wait_time = int(retry_after) + 1
+        limiter.pause(wait_time)
+        limiter.defer(chat_id, wait_time)
+        deferred = await self._defer_queued(chat_id, int(time.time()) + wait_time, [task["id"]])
+        print(f"⚠️ FloodWait for chat {chat_id}: deferred {deferred} task(s) by {wait_time}s")
+    
+    async def _defer_queued(self, chat_id: int, not_before: int,
+                            task_ids: Optional[List[int]] = None) -> int:
+        """
+        Return task_ids and this chat's queued tasks to 'pending', not to be
+        sent before not_before, keeping their order.
         
-        # Check if message not found in channel
-        if "message to forward not found" in error_msg.lower():
-            print(f"❌ Message {message_id} not found in channel {source_channel_id}")
-            return False  # Don't retry
+        Returns:
+            Number of tasks deferred
+        """
+        queue = self._chat_queues[chat_id]
+        task_ids = (task_ids or []) + [t["id"] for t in queue]
+        self._discard(queue)
         
-        print(f"❌ Error sending to {chat_id}: {e}")
-        return False
+        if task_ids:
+            await defer_tasks(task_ids, not_before, owner=WORKER_ID)
+        return len(task_ids)
+    
+    async def join(self):
+        """Wait until every submitted task has been handled."""
+        while self._runners:
+            await asyncio.gather(*list(self._runners))
+
+
+class Scheduler:
+    """
+    Min-heap of upcoming send_at times.
+    
+    Seeded from the database after every pass and fed by wake-up
+    notifications from bot.py, so the worker sleeps until exactly the next
+    due task instead of polling.
+    """
+    
+    def __init__(self):
+        self._heap = []
+        self._changed = asyncio.Event()
+    
+    def schedule(self, when: int):
+        """Register a time at which a task becomes due."""
+        heapq.heappush(self._heap, when)
+        self._changed.set()
+    
+    async def sleep_until_due(self, max_sleep: float):
+        """Sleep until the earliest scheduled time, an earlier wake-up, or max_sleep."""
+        deadline = time.time() + max_sleep
         
-    except Exception as e:
-        print(f"❌ Unexpected error: {e}")
-        return False
+        while True:
+            now = time.time()
+            if self._heap and self._heap[0] <= now:
+                # Drop everything that is due now; one claim pass covers it
+                while self._heap and self._heap[0] <= now:
+                    heapq.heappop(self._heap)
+                return
+            
+            wake_at = min(self._heap[0], deadline) if self._heap else deadline
+            if wake_at <= now:
+                return
+            
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=wake_at - now)
+            except asyncio.TimeoutError:
+                pass
+
 
+async def process_tasks(pool: BotPool):
+    """
+    Main worker loop - processes pending tasks and queued broadcast jobs.
+    """
+    # Drip tasks and broadcasts share the pool, so they share each bot's send budget
+    scheduler = Scheduler()
+    runner = BroadcastRunner(pool, WORKER_ID)
+    listener = WakeupListener(scheduler.schedule, runner.wake)
+    
+    if listener.start():
+        max_idle = MAX_IDLE_SLEEP
+        print(f"⏳ Worker started. Waking at the next due task (wake-up socket: {listener.path})")
+    else:
+        max_idle = POLL_INTERVAL
+        print(f"⏳ Worker started. Checking for tasks every {POLL_INTERVAL} seconds...")
+    
+    dispatcher = Dispatcher(pool, MAX_IN_FLIGHT)
+    
+    try:
+        await asyncio.gather(
+            _run_scheduler_loop(dispatcher, scheduler, max_idle),
+            runner.run_forever(max_idle),
+            _run_retention_loop(),
+            _run_heartbeat_loop(pool)
+        )
+    finally:
+        listener.close()
+        await unregister_worker(WORKER_ID)
 
 
-async def process_tasks(bot: Bot):
+async def _run_scheduler_loop(dispatcher: Dispatcher, scheduler: Scheduler, max_idle: float):
     """
-    Main worker loop - processes pending tasks.
+    Claim due tasks page by page while the dispatcher has room, then sleep
+    until the next one is due.
+    
+    Memory stays bounded by QUEUE_CAPACITY however large the backlog is:
+    the loop blocks until sends finish instead of claiming more. Stale and
+    superseded tasks are expired first, so a backlog only sends what still
+    makes sense.
     """
-    print("⏳ Worker started. Checking for tasks every 5 seconds...")
+    last_sweep = 0.0
     
     while True:
         try:
-            # Get all pending tasks that are due
-            pending_tasks = get_pending_tasks()
+            if time.time() - last_sweep >= EXPIRY_SWEEP_INTERVAL:
+                last_sweep = time.time()
+                expired = await expire_stale_tasks(SUPERSEDE_AFTER)
+                if expired:
+                    print(f"⌛ Expired {expired} stale or superseded tasks")
+            
+            # Backpressure: only claim what the dispatcher can take now
+            free = await dispatcher.wait_for_capacity(QUEUE_CAPACITY)
+            page_size = min(CLAIM_BATCH_SIZE, free)
+            
+            # Lease due tasks (and tasks whose previous lease expired)
+            pending_tasks = await claim_due_tasks(WORKER_ID, page_size, LEASE_SECONDS)
             
             if pending_tasks:
-                print(f"📋 Found {len(pending_tasks)} pending tasks")
+                print(f"📋 Claimed {len(pending_tasks)} due tasks ({dispatcher.pending} already queued)")
             
+            # Send concurrently (ordered per chat) in the background
             for task in pending_tasks:
-                task_id = task["id"]
-                retries = task.get("retries", 0)
-                
-                print(f"📤 Sending task {task_id} (type: {task['task_type']}) to {task['chat_id']}")
-                
-                # Try to send message
-                success = await send_task_message(bot, task)
-                
-                if success:
-                    # Mark as sent
-                    update_task_status(task_id, "sent")
-                    print(f"✅ Task {task_id} sent successfully")
-                    
-                elif retries < MAX_RETRIES:
-                    # Increment retry counter, keep as pending
-                    update_task_status(task_id, "pending", increment_retry=True)
-                    print(f"🔄 Task {task_id} failed, will retry (attempt {retries + 1}/{MAX_RETRIES})")
-                    
-                else:
-                    # Max retries exceeded, mark as failed
-                    update_task_status(task_id, "failed")
-                    print(f"❌ Task {task_id} failed after {MAX_RETRIES} attempts")
-            
-            # Sleep before next check
-            await asyncio.sleep(POLL_INTERVAL)
+                dispatcher.submit(task)
+            
+            # A full page means more work is waiting
+            if len(pending_tasks) >= page_size:
+                continue
+            
+            # Sleep until the next task is due (or bot.py wakes us early)
+            next_due = await get_next_due_time()
+            if next_due is not None:
+                scheduler.schedule(next_due)
+            await scheduler.sleep_until_due(max_idle)
             
         except KeyboardInterrupt:
             print("\n🛑 Worker stopped by user")
@@ -189,10 +453,65 @@ async def process_tasks(bot: Bot):
             await asyncio.sleep(POLL_INTERVAL)
 
 
+async def _run_retention_loop():
+    """
+    Archive finished tasks past TASK_RETENTION_DAYS every ARCHIVE_INTERVAL,
+    then return the freed pages with incremental vacuum.
+    
+    Every batch is its own short transaction and database call, so claims
+    and status updates of this worker and bot.py run in between.
+    """
+    while True:
+        try:
+            before = int(time.time()) - TASK_RETENTION_DAYS * 86400
+            archived = 0
+            while True:
+                count = await archive_finished_tasks(before, ARCHIVE_BATCH_SIZE)
+                archived += count
+                if count < ARCHIVE_BATCH_SIZE:
+                    break
+            
+            freed = await vacuum_free_pages(VACUUM_MAX_PAGES)
+            if archived or freed:
+                print(f"🗄️ Archived {archived} finished tasks, freed {freed} database pages")
+            
+        except Exception as e:
+            print(f"❌ Retention error: {e}")
+        
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+
+async def _run_heartbeat_loop(pool: BotPool):
+    """
+    Mark this worker live every WORKER_HEARTBEAT_INTERVAL and give each bot's
+    rate limiter its share of RATE_LIMIT_GLOBAL, split between live workers.
+    
+    Workers on every host send from the same bots, so a per-process budget
+    alone would let N workers send at N times Telegram's limit. A worker
+    joining or leaving is picked up within one interval.
+    """
+    workers = 0
+    
+    while True:
+        try:
+            live = await register_worker(WORKER_ID, WORKER_STALE_AFTER)
+            if live and live != workers:
+                workers = live
+                for limiter in pool.limiters:
+                    limiter.set_share(live)
+                print(f"👷 {live} live worker(s): sending up to {pool.limiters[0].max_rate:.1f} msg/s per bot")
+            
+        except Exception as e:
+            print(f"❌ Worker heartbeat error: {e}")
+        
+        await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+
 async def main():
     """Initialize bot and start worker."""
     
-    if not BOT_TOKEN:
+    tokens = load_tokens()
+    if not tokens:
         print("❌ ERROR: TELEGRAM_BOT_TOKEN not set in .env file!")
         return
     
@@ -201,22 +520,29 @@ async def main():
     
     print("🤖 Initializing worker...")
     print(f"📁 Storage directory: {os.path.abspath('storage')}")
+    print(f"🆔 Worker ID: {WORKER_ID}")
     print(f"🔄 Max retries: {MAX_RETRIES}")
+    print(f"🚀 Max in-flight sends: {MAX_IN_FLIGHT}")
+    print(f"📦 Claim page size: {CLAIM_BATCH_SIZE}, queue capacity: {QUEUE_CAPACITY}")
+    print(f"📢 Broadcast concurrency: starts at {os.getenv('BROADCAST_BATCH_SIZE', '10')}, "
+          f"adapts up to {os.getenv('BROADCAST_MAX_CONCURRENCY', '100')}")
     print(f"⏱️ Poll interval: {POLL_INTERVAL}s")
+    print(f"🤖 Sending bots: {len(tokens)} (1 primary + {len(tokens) - 1} helper)")
     
-    # Create bot instance
-    bot = Bot(token=BOT_TOKEN)
+    # Create bot instances, one rate limiter each
+    pool = BotPool(tokens)
     
-    # Test bot connection
-    try:
-        bot_info = await bot.get_me()
-        print(f"✅ Connected as @{bot_info.username}")
-    except Exception as e:
-        print(f"❌ Could not connect to Telegram: {e}")
+    # Test bot connections
+    if not await pool.connect():
+        return
+    
+    # Every copy needs the source channel; refuse to start rather than fail every task
+    source_channel_id = int(os.getenv("SOURCE_CHANNEL_ID", "0"))
+    if source_channel_id and not await pool.check_source_chat(source_channel_id):
         return
     
     # Start processing tasks
-    await process_tasks(bot)
+    await process_tasks(pool)
 
 
 if __name__ == "__main__":